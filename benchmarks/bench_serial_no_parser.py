@@ -0,0 +1,56 @@
+"""
+Compare per-call `SerialNoParser.parse_serial_no` against the batch API on synthetic file names.
+
+Usage:
+    python -m benchmarks.bench_serial_no_parser [n_names] [n_unique]
+"""
+
+import random
+import sys
+import time
+
+from lib.external.base import SerialNoParser
+
+
+def make_names(n_names: int, n_unique: int, seed: int = 0):
+    rng = random.Random(seed)
+
+    def gen():
+        kind = rng.random()
+        if kind < 0.25:
+            name = f"FC2-PPV-{rng.randint(1000000, 4999999)}"
+        elif kind < 0.7:
+            prefix = "".join(rng.choices("ABCDEFGHIJKLMNOPQRSTUVWXYZ", k=rng.randint(3, 5)))
+            name = f"{prefix}{rng.choice(('-', '', '_'))}{rng.randint(1, 999):03d}"
+        elif kind < 0.85:
+            name = f"{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}{rng.randint(10, 23):02d}_{rng.randint(1, 999):03d}"
+        else:
+            name = "".join(rng.choices("abcdefghijklmnopqrstuvwxyz ", k=20))
+        return f"[{rng.choice(('HD', '4K', 'Uncensored'))}] {name} {rng.choice(('', 'part1', 'ch'))}.mp4"
+
+    uniques = [gen() for _ in range(n_unique)]
+    return [rng.choice(uniques) for _ in range(n_names)]
+
+
+def timeit(func, *args):
+    start = time.perf_counter()
+    res = func(*args)
+    return time.perf_counter() - start, res
+
+
+def main(n_names: int = 300_000, n_unique: int = 50_000):
+    names = make_names(n_names, n_unique)
+
+    t_per_call, res_per_call = timeit(lambda xs: [SerialNoParser.parse_serial_no(x) for x in xs], names)
+    SerialNoParser._parse_name.cache_clear()
+    t_cold, res_cold = timeit(SerialNoParser.parse_serial_nos, names)
+    t_warm, res_warm = timeit(SerialNoParser.parse_serial_nos, names)
+    assert res_per_call == res_cold == res_warm
+
+    print(f"{n_names} names ({n_unique} unique)")
+    for label, t in (("per call", t_per_call), ("batch (cold)", t_cold), ("batch (warm)", t_warm)):
+        print(f"{label:<14}: {t:8.3f}s {n_names / t:12,.0f} names/s  x{t_per_call / t:.1f}")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:3]))
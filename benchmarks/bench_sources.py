@@ -0,0 +1,191 @@
+"""
+Offline benchmark of source APIs on recorded pages, see `fixtures/manifest.json`.
+
+Reports throughput, p50/p99 latency and peak traced memory of
+    - single lookups of each source, one at a time
+    - batch resolution through `Resolver` at several concurrency levels
+    - field extraction of each fixture page, ops/s in CPU time
+
+Usage:
+    python -m benchmarks.bench_sources [--latency 0.05] [--jitter 0.05] [--error-rate 0.01] [--throttled]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+from typing import Callable, List
+
+import httpx
+from lxml import etree
+
+from lib.external.base import ReplayTransport, ThrottledTransport, TransportConfig
+from lib.external.base.extractor import Extractor, Records, Table
+from lib.external.fc2 import FC2Api
+from lib.external.javlibrary import JavLibraryApi
+from lib.external.missav import MissAvApi
+from lib.external.resolver import Resolver
+from lib.external.tokyolib import TokyoLibApi
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+API_CLASSES = (MissAvApi, JavLibraryApi, TokyoLibApi, FC2Api)
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Report:
+    header = f"{'case':<40}{'n':>7}{'ops/s':>11}{'p50 ms':>10}{'p99 ms':>10}{'peak KiB':>11}"
+
+    def __init__(self, title: str):
+        self.title = title
+        print(f"\n## {title}\n{self.header}")
+
+    @staticmethod
+    def row(case: str, latencies: List[float], elapsed: float, peak: int):
+        print(
+            f"{case:<40}{len(latencies):>7}{len(latencies) / elapsed:>11,.1f}"
+            f"{percentile(latencies, .5) * 1e3:>10.2f}{percentile(latencies, .99) * 1e3:>10.2f}{peak / 1024:>11,.0f}"
+        )
+
+
+def make_session(args) -> httpx.AsyncClient:
+    transport = ReplayTransport.from_directory(
+        FIXTURES, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=0,
+    )
+    if args.throttled:
+        transport = ThrottledTransport(TransportConfig(rate=None, backoff_base=0.01), transport=transport)
+    return httpx.AsyncClient(transport=transport)
+
+
+async def measure(coro_funcs: List[Callable], concurrency: int):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(func):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await func()
+            except Exception:  # injected errors
+                pass
+            latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(timed(func) for func in coro_funcs))
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return latencies, elapsed, peak
+
+
+def serials_of(api_class, n: int, miss_ratio: float = 0.2) -> List[str]:
+    n_miss = int(n * miss_ratio)
+    if api_class is FC2Api:
+        return [f"FC2-PPV-{1000000 + i}" for i in range(n - n_miss)] + [f"FC2-PPV-{9000000 + i}" for i in range(n_miss)]
+    return [f"ABC-{i:03d}" for i in range(n - n_miss)] + [f"ZZZ-{i:03d}" for i in range(n_miss)]
+
+
+async def bench_single(args):
+    report = Report("single lookup, sequential")
+    async with make_session(args) as session:
+        for api_class in API_CLASSES:
+            api = api_class(session)
+            funcs = [lambda s=s: api.get_video_detail(s) for s in serials_of(api_class, args.n)]
+            report.row(api_class.__name__, *await measure(funcs, 1))
+
+
+async def bench_batch(args):
+    report = Report("batch resolution via Resolver")
+    serials = [s for api_class in (MissAvApi, FC2Api) for s in serials_of(api_class, args.n_batch // 2)]
+    for policy in ("first", "merge"):
+        for concurrency in args.concurrency:
+            async with make_session(args) as session:
+                resolver = Resolver([api_class(session) for api_class in API_CLASSES], policy=policy)
+                funcs = [lambda s=s: resolver.resolve(s) for s in serials]
+                report.row(f"{policy}, concurrency={concurrency}", *await measure(funcs, concurrency))
+
+
+EXTRACTORS = {
+    "fc2/detail.html": FC2Api.extractor_detail,
+    "javlibrary/detail.html": JavLibraryApi.extractor_detail,
+    "javlibrary/search.html": JavLibraryApi.extractor_search,
+    "missav/detail.html": MissAvApi.extractor_detail["ja"],
+    "missav/search.html": MissAvApi.extractor_search,
+    "tokyolib/detail.html": TokyoLibApi.extractor_detail,
+    "tokyolib/search.html": TokyoLibApi.extractor_search,
+}
+
+
+def extract_uncompiled(extractor: Extractor, content: bytes):
+    """
+    Same work as `extractor.extract`, done the way the APIs used to: full parse of decoded text and XPath strings
+    evaluated from scratch on every call.
+    """
+
+    def evaluate(field, element):
+        if isinstance(field, Table):
+            for row in element.xpath(field.rows.path):
+                if (item := field._lookup(row.xpath(field.label.path))) is not None:
+                    row.xpath(item[1].xpath.path)
+        elif isinstance(field, Records):
+            for row in element.xpath(field.rows.path):
+                for f in field.fields.values():
+                    row.xpath(f.xpath.path)
+        else:
+            element.xpath(field.xpath.path)
+
+    root = etree.HTML(content.decode("utf-8"))
+    for field in extractor.fields.values():
+        evaluate(field, root)
+
+
+def bench_parse(args):
+    report = Report("HTML extraction, uncompiled full parse vs Extractor")
+    for page, extractor in EXTRACTORS.items():
+        with open(os.path.join(FIXTURES, page), "rb") as f:
+            content = f.read()
+
+        cases = (
+            ("uncompiled", lambda: extract_uncompiled(extractor, content)),
+            ("extractor", lambda: extractor.extract(content, "utf-8")),
+        )
+        for label, func in cases:
+            latencies = []
+            start = time.process_time()
+            for _ in range(args.n_parse):
+                t = time.perf_counter()
+                func()
+                latencies.append(time.perf_counter() - t)
+            elapsed = time.process_time() - start
+
+            tracemalloc.start()
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            report.row(f"{page} ({label})", latencies, elapsed, peak)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds of injected latency per request")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.)
+    parser.add_argument("--throttled", action="store_true", help="go through ThrottledTransport, with retries")
+    parser.add_argument("--n", type=int, default=50, help="lookups per source in single mode")
+    parser.add_argument("--n-batch", type=int, default=500)
+    parser.add_argument("--n-parse", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    args = parser.parse_args()
+
+    asyncio.run(bench_single(args))
+    asyncio.run(bench_batch(args))
+    bench_parse(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,10 @@
 from .common import JavInfo, JavRecord, BaseApi, BaseClient, SerialNoParser
+from .extractor import Extractor, Field, Table, Records
+from .thumbnail import Thumbnail, ThumbnailStore
+from .url_index import UrlIndex
+from .transport import TransportConfig, ThrottledTransport
+from .replay import Fixture, ReplayTransport, RecordingTransport
+from .cache import BaseCache, MemoryCache, SqliteCache, CachedApi
 
 default_proxies = {
     "http://": "http://127.0.0.1:10809",
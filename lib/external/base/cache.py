@@ -0,0 +1,220 @@
+import inspect
+import json
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import Any, List, Optional, Tuple
+
+from .common import BaseApi, JavInfo, JavRecord, SerialNoParser
+
+__all__ = ["MISSING", "BaseCache", "MemoryCache", "SqliteCache", "CachedApi"]
+
+MISSING = object()
+
+
+class BaseCache(ABC):
+    """
+    Key-value store of serialized results with expiration. Values are str, `None` never expires.
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+
+    @abstractmethod
+    def get(self, key: str) -> Any:
+        """
+        Returns:
+            cached value, or `MISSING` if the key is absent or expired
+        """
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        pass
+
+    @abstractmethod
+    def delete(self, key: str):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+
+class MemoryCache(BaseCache):
+    """
+    In-process LRU cache.
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        super().__init__(max_entries)
+        self._data: OrderedDict[str, Tuple[str, Optional[float]]] = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: str) -> Any:
+        if (item := self._data.get(key)) is None:
+            return MISSING
+
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            return MISSING
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        self._data[key] = (value, None if ttl is None else time.time() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+class SqliteCache(BaseCache):
+    """
+    Persistent cache in a single SQLite file. Entries beyond `max_entries` are evicted by least recent access,
+    checked once every `evict_every` writes.
+    """
+
+    def __init__(self, path: str, max_entries: int = 1_000_000, evict_every: int = 256):
+        super().__init__(max_entries)
+        self.path = path
+        self.evict_every = evict_every
+        self._writes = 0
+
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed_at ON cache (accessed_at)")
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def get(self, key: str) -> Any:
+        row = self.conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return MISSING
+
+        value, expires_at = row
+        now = time.time()
+        if expires_at is not None and expires_at <= now:
+            self.delete(key)
+            return MISSING
+
+        self.conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, value, None if ttl is None else now + ttl, now),
+        )
+        self._writes += 1
+        if self._writes % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        self.conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+        self.conn.execute(
+            "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def delete(self, key: str):
+        self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        self.conn.execute("DELETE FROM cache")
+
+    def close(self):
+        self.conn.close()
+
+
+class CachedApi:
+    """
+    Wrap a `BaseApi` so that `get_video_detail` and `search_by_keyword` are served from `cache` when possible.
+    Misses (None or empty search results) are cached as well, with their own ttl, so the wrapped api must raise
+    rather than return a miss when a site fails. Other attributes are delegated to the wrapped api.
+    """
+
+    def __init__(
+            self,
+            api: BaseApi,
+            cache: BaseCache,
+            ttl_hit: Optional[float] = 30 * 86400,
+            ttl_miss: Optional[float] = 86400,
+    ):
+        """
+
+        Args:
+            api: BaseApi
+            cache: BaseCache
+            ttl_hit: float, optional
+                seconds to keep found results, None for never expire
+            ttl_miss: float, optional
+                seconds to keep misses, None for never expire
+        """
+
+        self.api = api
+        self.cache = cache
+        self.ttl_hit = ttl_hit
+        self.ttl_miss = ttl_miss
+
+    def __getattr__(self, name):
+        return getattr(self.api, name)
+
+    def _key(self, method: str, keyword: str, **arguments) -> str:
+        extra = (f"{k}={v}" for k, v in arguments.items())
+        return "|".join((self.api.source, self.api.lang, method, keyword, *extra))
+
+    async def get_video_detail(self, serial_no_reg: str, with_thumbnail=False) -> Optional[JavInfo]:
+        # the wrapped api gets the same serial number as the key, so that a miss of a loose spelling like "abc123"
+        # is not cached for "ABC-123"
+        serial_no_reg = SerialNoParser.parse_serial_no(serial_no_reg) or SerialNoParser.clean_serial_no(serial_no_reg)
+        key = self._key("detail", serial_no_reg)
+
+        if (value := self.cache.get(key)) is not MISSING:
+            if (d := json.loads(value)) is None:
+                return None
+            if not with_thumbnail or d.get("thumbnail"):  # otherwise fetch again along with the thumbnail
+                return JavInfo.from_dict(d)
+
+        jav = await self.api.get_video_detail(serial_no_reg, with_thumbnail=with_thumbnail)
+        if jav is None:
+            self.cache.set(key, "null", self.ttl_miss)
+        else:
+            self.cache.set(key, json.dumps(jav.to_dict(), ensure_ascii=False), self.ttl_hit)
+        return jav
+
+    async def search_by_keyword(self, keyword: str, *args, **kwargs) -> List[JavRecord]:
+        # bound by name with defaults, so that `(kw, 2)`, `(kw, page_no=2)` and alike share the same key
+        bound = inspect.signature(self.api.search_by_keyword).bind(keyword, *args, **kwargs)
+        bound.apply_defaults()
+        _, *arguments = bound.arguments.items()
+        key = self._key("search", SerialNoParser.clean_serial_no(keyword), **dict(arguments))
+
+        if (value := self.cache.get(key)) is not MISSING:
+            return [JavRecord(**d) for d in json.loads(value)]
+
+        records = await self.api.search_by_keyword(keyword, *args, **kwargs)
+        self.cache.set(
+            key,
+            json.dumps([asdict(record) for record in records], ensure_ascii=False),
+            self.ttl_hit if len(records) > 0 else self.ttl_miss,
+        )
+        return records
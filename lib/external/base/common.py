@@ -1,17 +1,27 @@
+import asyncio
 import datetime as dt
+import itertools
+import os
 import re
 from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import aclosing
 from dataclasses import dataclass
+from functools import lru_cache
 from io import BytesIO
-from typing import Optional, List, Tuple, Iterable
+from typing import Optional, List, Tuple, Iterable, Iterator, Union, AsyncIterator, Deque
 
 import httpx
 from PIL.Image import Image, open as image_open
 
+from .thumbnail import Thumbnail, ThumbnailStore
+from .url_index import UrlIndex
+from .transport import HostThrottle, ThrottledTransport, TransportConfig
+
 __all__ = ["BaseApi", "BaseClient", "JavInfo", "JavRecord", "SerialNoParser"]
 
 
-@dataclass
+@dataclass(slots=True)
 class JavRecord:
     keyword: str
     title: str
@@ -26,7 +36,7 @@ class JavInfo:
             title: Optional[str] = "",
             casts: Optional[List[str]] = None,
             publish_date: Optional[str] = "",
-            thumbnail: Optional[Image] = None,
+            thumbnail: Optional[Thumbnail] = None,
             length: Optional[int] = 0,
 
             maker: Optional[str] = "",
@@ -58,6 +68,60 @@ class JavInfo:
             self._title = self._title_original.replace(self.serial_no, "").strip()
         return self._title
 
+    def to_dict(self) -> dict:
+        """
+        Plain fields of this info, `JavInfo.from_dict` restores it. Only the path of a stored thumbnail is kept.
+        """
+
+        return {
+            "serial_no": self.serial_no,
+            "title": self._title_original,
+            "casts": self.casts,
+            "publish_date": self.publish_date,
+            "length": self.length,
+            "maker": self.maker,
+            "publisher": self.publisher,
+            "director": self.director,
+            "source": self.source,
+            "thumbnail": self.thumbnail.path if self.thumbnail is not None else None,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "JavInfo":
+        thumbnail = Thumbnail(path=path) if (path := d.get("thumbnail")) else None
+        return cls(**{**d, "thumbnail": thumbnail})
+
+    def merge(self, *others: "JavInfo") -> "JavInfo":
+        """
+        Combine infos of the same video from several sources, empty fields of this info are filled with the
+        first non-empty value of `others`, in the given order.
+
+        Args:
+            others: JavInfo
+                infos with lower precedence
+
+        Returns:
+
+        """
+
+        infos = (self, *others)
+
+        def pick(attr):
+            return next((v for info in infos if (v := getattr(info, attr))), getattr(self, attr))
+
+        return JavInfo(
+            serial_no=self.serial_no,
+            title=next((x for info in infos if (x := info._title_original)), ""),
+            casts=pick("casts"),
+            publish_date=pick("publish_date"),
+            thumbnail=pick("thumbnail"),
+            length=pick("length"),
+            maker=pick("maker"),
+            publisher=pick("publisher"),
+            director=pick("director"),
+            source=",".join(dict.fromkeys(info.source for info in infos if info.source)),
+        )
+
     def show_info(self):
         print(self.__repr__())
 
@@ -82,8 +146,15 @@ class BaseApi(ABC):
     url_domain = ""
     _lang = "ja"
 
-    def __init__(self, session: httpx.AsyncClient):
+    def __init__(
+            self,
+            session: httpx.AsyncClient,
+            thumbnail_store: Optional[ThumbnailStore] = None,
+            url_index: Optional[UrlIndex] = None,
+    ):
         self.session = session
+        self.thumbnail_store = thumbnail_store
+        self.url_index = url_index
 
     @property
     def lang(self):
@@ -98,6 +169,20 @@ class BaseApi(ABC):
     def url_domain_lang(self):
         return f"{self.url_domain}/{self.lang}"
 
+    def supports(self, serial_no_reg: str) -> bool:
+        """
+        Whether this source is worth querying for the given regularized serial number.
+
+        Args:
+            serial_no_reg: str
+                regularized serial number
+
+        Returns:
+
+        """
+
+        return not serial_no_reg.startswith("FC2-PPV-")
+
     @staticmethod
     def strip_all(strings: Iterable[str], drop_empty_str=False) -> List[str]:
         if drop_empty_str:
@@ -111,6 +196,123 @@ class BaseApi(ABC):
         resp = await self._make_request(url, **kwargs)
         return image_open(BytesIO(resp.content))
 
+    async def _make_request_thumbnail(self, url: str, **kwargs) -> Optional[Thumbnail]:
+        """
+        Streamed into `thumbnail_store` if there is one, otherwise kept as encoded bytes.
+        """
+
+        if self.thumbnail_store is not None:
+            return await self.thumbnail_store.fetch(self.session, url, **kwargs)
+
+        resp = await self._make_request(url, **kwargs)
+        return Thumbnail(data=resp.content) if resp.status_code == 200 else None
+
+    def _index_records(self, records: Iterable[JavRecord]):
+        """
+        Remember detail urls of records whose keyword is a regularized serial number, the first one wins if a
+        serial number is listed several times.
+        """
+
+        if self.url_index is None:
+            return
+
+        items = {}
+        for record in records:
+            keyword = SerialNoParser.clean_serial_no(record.keyword)
+            if SerialNoParser.parse_serial_no(keyword) == keyword:
+                items.setdefault(keyword, record.url)
+        self.url_index.put_many(self.source, items.items())
+
+    def _lookup_url(self, serial_no_reg: str) -> Optional[str]:
+        if self.url_index is None:
+            return None
+        return self.url_index.get(self.source, serial_no_reg)
+
+    async def iter_search(
+            self,
+            keyword: str,
+            prefetch: int = 1,
+            max_pages: Optional[int] = None,
+            **kwargs,
+    ) -> AsyncIterator[JavRecord]:
+        """
+        Stream records of all result pages of `keyword`, fetching the next pages while the current one is consumed.
+        Records already seen on previous pages are skipped, and the iteration ends at the first page bringing
+        nothing new, i.e. an empty page or a site repeating its last page.
+
+        Pending prefetches are cancelled when the consumer stops early, wrap the iterator with
+        `contextlib.aclosing` to have it done right at `break`:
+
+            async with aclosing(api.iter_search("ABP")) as records:
+                async for record in records:
+                    ...
+
+        Args:
+            keyword: str
+            prefetch: int
+                number of pages fetched ahead of the one being consumed
+            max_pages: int, optional
+            **kwargs:
+                passed to `search_by_keyword`
+
+        Returns:
+
+        """
+
+        pages = itertools.count(1) if max_pages is None else iter(range(1, max_pages + 1))
+        pending: Deque[asyncio.Task] = deque()
+
+        def schedule():  # the next page to consume and `prefetch` pages after it
+            while len(pending) < prefetch + 1 and (page_no := next(pages, None)) is not None:
+                pending.append(asyncio.create_task(self.search_by_keyword(keyword, page_no=page_no, **kwargs)))
+
+        seen = set()
+        try:
+            schedule()
+            while len(pending) > 0:
+                records = await pending.popleft()
+                if len(records := [record for record in records if record.url not in seen]) == 0:
+                    break
+                seen.update(record.url for record in records)
+
+                for record in records:  # only `prefetch` pages are in flight meanwhile
+                    yield record
+                schedule()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def warm_up_url_index(self, keywords: Iterable[str], max_pages: int = 1, concurrency: int = 4) -> int:
+        """
+        Fill `url_index` by crawling search result pages, e.g. of serial number prefixes like "ABP".
+
+        Args:
+            keywords: Iterable[str]
+            max_pages: int
+                max number of result pages to crawl for each keyword
+            concurrency: int
+                number of keywords crawled at the same time
+
+        Returns:
+            int
+                number of records seen
+        """
+
+        assert self.url_index is not None
+        keywords = iter(keywords)
+        n_records = 0
+
+        async def worker():
+            nonlocal n_records
+            for keyword in keywords:
+                async with aclosing(self.iter_search(keyword, prefetch=0, max_pages=max_pages)) as records:
+                    async for _ in records:
+                        n_records += 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return n_records
+
     @abstractmethod
     def search_by_keyword(self, keyword: str) -> List[JavRecord]:
         pass
@@ -128,11 +330,32 @@ class BaseClient(ABC):
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/77.0.3865.120 Safari/537.36",
         "Proxy-Connection": "keep-alive",
     }
+    transport_config = TransportConfig()
 
     def prepare_session(self, **session_args):
+        """
+
+        Args:
+            **session_args:
+                proxies: Dict[str, str], optional
+                    e.g. {"https://": "http://127.0.0.1:10809"}
+                transport_config: TransportConfig, optional
+                    rate limit, connection pool and retry settings, defaults to `BaseClient.transport_config`
+
+        Returns:
+
+        """
+
+        config = session_args.get("transport_config") or self.transport_config
+        throttle = HostThrottle(config)  # shared by proxied and direct transports, limits are per host anyway
         session = httpx.AsyncClient(
-            proxies=session_args.get("proxies"),
             headers=self.default_headers,
+            timeout=config.timeout,
+            transport=ThrottledTransport(config, throttle),
+            mounts={
+                pattern: ThrottledTransport(config, throttle, proxy=proxy)
+                for pattern, proxy in (session_args.get("proxies") or {}).items()
+            },
         )
         return session
 
@@ -166,6 +389,14 @@ class SerialNoParser:
     serial_no_dpr = r"(?<![\d])\d{3}"
     patt_dpr = re.compile(f"(?<![0-9])({serial_prefix_dpr}){split_must}({serial_no_dpr})")
 
+    # All of above as one alternation, in order of precedence. A search finds the leftmost serial number,
+    # only a later one of higher precedence needs another look
+    patt_any = re.compile("|".join((
+        f"(?P<fc2>{prefixes_fc2}){split_possible}(?P<fc2_no>{serial_no_fc2})",
+        f"(?<![a-zA-Z])(?P<censored>{serial_prefix_censored}){split_possible}(?P<censored_no>{serial_no_censored})",
+        f"(?<![0-9])(?P<dpr>{serial_prefix_dpr}){split_must}(?P<dpr_no>{serial_no_dpr})",
+    )))
+
     @staticmethod
     def clean_serial_no(serial_no: str) -> str:
         return serial_no.strip().upper()
@@ -208,7 +439,6 @@ class SerialNoParser:
             return None
 
         if (last_two_digit := prefix[-2:]).isnumeric() and last_two_digit[-2:] > cls.year_suffix:
-            print(prefix, serial_no)
             return None
         return f"{prefix}_{number}" if prefix is not None else None
 
@@ -222,6 +452,123 @@ class SerialNoParser:
             return f"FC2-PPV-{matched.group()}"
         return None
 
+    @classmethod
+    def _parse_serial_no_single_pass(cls, serial_no: str, extend_fc2_from_no: bool = False) -> Optional[str]:
+        if (matched := cls.patt_any.search(serial_no)) is None:
+            if extend_fc2_from_no and (matched := cls.patt_fc2_less.search(serial_no)) is not None:
+                return f"FC2-PPV-{matched.group()}"
+            return None
+
+        if (kind := matched.lastgroup) == "fc2_no":
+            return f"FC2-PPV-{matched['fc2_no']}"
+
+        pos = matched.start()
+        if "FC" in serial_no[pos:] and (matched_fc2 := cls.patt_fc2.search(serial_no, pos)) is not None:
+            return f"FC2-PPV-{matched_fc2.group(2)}"
+
+        if extend_fc2_from_no and (matched_fc2 := cls.patt_fc2_less.search(serial_no)) is not None:
+            return f"FC2-PPV-{matched_fc2.group()}"
+
+        if kind == "censored_no":
+            return f"{matched['censored']}-{matched['censored_no']}"
+
+        if (matched_censored := cls.patt_censored.search(serial_no, pos)) is not None:
+            return f"{matched_censored.group(1)}-{matched_censored.group(2)}"
+
+        if (prefix := matched["dpr"])[-2:] > cls.year_suffix:
+            return None
+        return f"{prefix}_{matched['dpr_no']}"
+
+    @staticmethod
+    @lru_cache(maxsize=1 << 17)
+    def _parse_name(name: str, extend_fc2_from_no: bool = False) -> Optional[str]:
+        return SerialNoParser._parse_serial_no_single_pass(SerialNoParser.clean_serial_no(name), extend_fc2_from_no)
+
+    @classmethod
+    def parse_serial_nos(
+            cls,
+            names: Iterable[Union[str, os.PathLike]],
+            extend_fc2_from_no: bool = False,
+    ) -> List[Optional[str]]:
+        """
+        Batch version of `parse_serial_no`, results of repeated names are memoized.
+
+        Args:
+            names: Iterable[Union[str, os.PathLike]]
+                file names or paths, only the base name of a path is parsed
+            extend_fc2_from_no: bool
+
+        Returns:
+            List[Optional[str]]
+                regularized serial numbers in the same order of `names`
+        """
+
+        parse = cls._parse_name
+        return [parse(os.path.basename(os.fspath(name)), extend_fc2_from_no) for name in names]
+
+    @staticmethod
+    def iter_files(
+            root: Union[str, os.PathLike],
+            extensions: Optional[Iterable[str]] = None,
+    ) -> Iterator[os.DirEntry]:
+        """
+        Lazily walk a directory tree and yield entries of files, symlinks of directories are not followed.
+
+        Args:
+            root: Union[str, os.PathLike]
+            extensions: Iterable[str], optional
+                e.g. (".mp4", ".mkv"), case-insensitive. All files are yielded if not given
+
+        Returns:
+
+        """
+
+        extensions = tuple(ext.lower() for ext in extensions) if extensions else None
+
+        stack = [os.fspath(root)]
+        while stack:
+            try:
+                it = os.scandir(stack.pop())
+            except OSError:  # vanished or unreadable directory
+                continue
+
+            with it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    if extensions is not None and not entry.name.lower().endswith(extensions):
+                        continue
+                    yield entry
+
+    @classmethod
+    def walk(
+            cls,
+            root: Union[str, os.PathLike],
+            extensions: Optional[Iterable[str]] = None,
+            with_unmatched: bool = False,
+            extend_fc2_from_no: bool = False,
+    ) -> Iterator[Tuple[str, Optional[str]]]:
+        """
+        Lazily walk a directory tree and yield `(path, serial_no_reg)` of files.
+
+        Args:
+            root: Union[str, os.PathLike]
+            extensions: Iterable[str], optional
+                e.g. (".mp4", ".mkv"), case-insensitive. All files are yielded if not given
+            with_unmatched: bool
+                whether to also yield files whose name contains no serial number, as `(path, None)`
+            extend_fc2_from_no: bool
+
+        Returns:
+
+        """
+
+        parse = cls._parse_name
+        for entry in cls.iter_files(root, extensions):
+            if (serial_no_reg := parse(entry.name, extend_fc2_from_no)) is not None or with_unmatched:
+                yield entry.path, serial_no_reg
+
 
 class SerialNo:
     def __init__(self, prefix, no, publisher=None):
@@ -0,0 +1,194 @@
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from lxml import etree
+
+__all__ = ["Field", "Table", "Records", "Extractor", "first", "last", "nth", "every"]
+
+
+def first(values: list) -> Any:
+    return values[0]
+
+
+def last(values: list) -> Any:
+    return values[-1]
+
+
+def nth(i: int) -> Callable[[list], Any]:
+    def pick(values: list) -> Any:
+        return values[i]
+    return pick
+
+
+def every(values: list) -> list:
+    return values
+
+
+class Field:
+    """
+    Value of a compiled XPath, evaluated relative to the element it is given.
+    """
+
+    def __init__(self, xpath: str, pick: Callable[[list], Any] = first, default: Any = None):
+        """
+
+        Args:
+            xpath: str
+            pick: Callable[[list], Any]
+                picks the value out of the non-empty result of `xpath`, e.g. `first`, `nth(1)`, `every`
+            default: Any
+                value when nothing is matched
+        """
+
+        self.xpath = etree.XPath(xpath)
+        self.pick = pick
+        self.default = default
+
+    def __call__(self, element) -> Any:
+        if not isinstance(values := self.xpath(element), list):  # string(), count() and alike
+            return values
+        try:
+            return self.pick(values)
+        except IndexError:
+            return self.default
+
+
+class Table:
+    """
+    Rows of label and value, e.g. <dl> or "key: value" lists. Fields are looked up by the label of a row and
+    evaluated relative to the row element.
+    """
+
+    def __init__(
+            self,
+            rows: str,
+            label: str,
+            fields: Dict[str, Tuple[str, Field]],
+            match: Optional[Callable[[str, str], bool]] = None,
+    ):
+        """
+
+        Args:
+            rows: str
+                XPath of row elements
+            label: str
+                XPath of the label relative to a row, returning a string. e.g. "string(./*[1])"
+            fields: Dict[str, Tuple[str, Field]]
+                {label: (name, field)}
+            match: Callable[[str, str], bool], optional
+                match(label of row, label of field). Exact match if not given
+        """
+
+        self.rows = etree.XPath(rows)
+        self.label = etree.XPath(label)
+        self.fields = fields
+        self.match = match
+
+    def _lookup(self, label: str) -> Optional[Tuple[str, Field]]:
+        if self.match is None:
+            return self.fields.get(label)
+        return next((v for key, v in self.fields.items() if self.match(label, key)), None)
+
+    def __call__(self, element) -> Dict[str, Any]:
+        res = {}
+        for row in self.rows(element):
+            if (item := self._lookup(self.label(row))) is not None:
+                name, field = item
+                res[name] = field(row)
+        return res
+
+
+class Records:
+    """
+    List of records, e.g. videos on a search result page.
+    """
+
+    def __init__(self, rows: str, fields: Dict[str, Field]):
+        self.rows = etree.XPath(rows)
+        self.fields = fields
+
+    def __call__(self, element) -> List[Dict[str, Any]]:
+        fields = self.fields.items()
+        return [{name: field(row) for name, field in fields} for row in self.rows(element)]
+
+
+class Extractor:
+    """
+    Schema of a page. Parses raw bytes and evaluates precompiled fields.
+
+    When `anchors` are given, only the part of the page from the earliest anchor up to `stop` is parsed, which
+    skips heavy <head>, navigation and comment sections. Each anchor should match an attribute of the outermost
+    element referred by the XPaths of fields, the whole page is parsed if any anchor is missing.
+    """
+
+    _parsers: Dict[str, etree.HTMLParser] = {}
+
+    def __init__(
+            self,
+            fields: Dict[str, Union[Field, Table, Records]],
+            anchors: Iterable[bytes] = (),
+            stop: Optional[bytes] = None,
+    ):
+        """
+
+        Args:
+            fields: Dict[str, Union[Field, Table, Records]]
+                {name: field}, fields of a `Table` are merged into the result under their own names
+            anchors: Iterable[bytes]
+                regular expressions, e.g. rb"id=[\"']video_info[\"']"
+            stop: bytes, optional
+                regular expression after which nothing is needed
+        """
+
+        self.fields = fields
+        self.anchors = [re.compile(anchor) for anchor in anchors]
+        self.stop = re.compile(stop) if stop is not None else None
+
+    @classmethod
+    def parser(cls, encoding: str) -> etree.HTMLParser:
+        if (parser := cls._parsers.get(encoding)) is None:
+            parser = cls._parsers[encoding] = etree.HTMLParser(encoding=encoding)
+        return parser
+
+    def region(self, content: bytes) -> bytes:
+        if len(self.anchors) == 0:
+            return content
+
+        start = len(content)
+        for anchor in self.anchors:
+            if (matched := anchor.search(content)) is None:
+                return content
+            start = min(start, matched.start())
+        start = max(content.rfind(b"<", 0, start), 0)
+
+        end = len(content)
+        if self.stop is not None and (matched := self.stop.search(content, start)) is not None:
+            end = max(content.rfind(b"<", start, matched.start()), start)
+        return content[start:end]
+
+    def parse(self, content: bytes, encoding: Optional[str] = None):
+        return etree.HTML(self.region(content), self.parser(encoding or "utf-8"))
+
+    def extract(self, content: bytes, encoding: Optional[str] = None) -> Dict[str, Any]:
+        """
+
+        Args:
+            content: bytes
+                raw body of response
+            encoding: str, optional
+                e.g. `httpx.Response.encoding`, defaults to utf-8
+
+        Returns:
+            Dict[str, Any]
+        """
+
+        if (root := self.parse(content, encoding)) is None:  # blank page
+            return {}
+
+        res = {}
+        for name, field in self.fields.items():
+            if isinstance(field, Table):
+                res.update(field(root))
+            else:
+                res[name] = field(root)
+        return res
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import os
+import random
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Pattern, Tuple, Union
+
+import httpx
+
+__all__ = ["Fixture", "ReplayTransport", "RecordingTransport"]
+
+
+@dataclass
+class Fixture:
+    status_code: int = 200
+    body: bytes = b""
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    Serve recorded responses instead of going to the sites, for offline tests and benchmarks.
+
+    Routes are matched in order by `re.search` against the full url. A fixture directory holds a
+    `manifest.json` of routes:
+        [{"url": "<regex>", "status_code": 200, "headers": {...}, "file": "<path relative to directory>"}]
+    """
+
+    def __init__(
+            self,
+            routes: Optional[List[Tuple[Union[str, Pattern], Fixture]]] = None,
+            latency: float = 0.,
+            jitter: float = 0.,
+            error_rate: float = 0.,
+            error_status: int = 503,
+            timeout_rate: float = 0.,
+            seed: Optional[int] = None,
+    ):
+        """
+
+        Args:
+            routes: List[Tuple[Union[str, Pattern], Fixture]], optional
+            latency: float
+                seconds to wait before every response
+            jitter: float
+                extra uniform(0, jitter) seconds to wait
+            error_rate: float
+                probability of answering `error_status` instead of the fixture
+            error_status: int
+            timeout_rate: float
+                probability of raising `httpx.ReadTimeout` after the latency
+            seed: int, optional
+        """
+
+        self.routes: List[Tuple[Pattern, Fixture]] = []
+        for pattern, fixture in routes or []:
+            self.add(pattern, fixture)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.timeout_rate = timeout_rate
+        self.random = random.Random(seed)
+        self.n_requests = 0
+
+    def add(self, pattern: Union[str, Pattern], fixture: Fixture):
+        self.routes.append((re.compile(pattern), fixture))
+
+    @classmethod
+    def from_directory(cls, root: str, **kwargs) -> "ReplayTransport":
+        with open(os.path.join(root, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        transport = cls(**kwargs)
+        for route in manifest:
+            body = b""
+            if (file := route.get("file")) is not None:
+                with open(os.path.join(root, file), "rb") as f:
+                    body = f.read()
+            transport.add(route["url"], Fixture(route.get("status_code", 200), body, route.get("headers", {})))
+        return transport
+
+    def match(self, url: str) -> Fixture:
+        for pattern, fixture in self.routes:
+            if pattern.search(url):
+                return fixture
+        return Fixture(404)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.n_requests += 1
+        if (delay := self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.)) > 0:
+            await asyncio.sleep(delay)
+
+        if self.timeout_rate and self.random.random() < self.timeout_rate:
+            raise httpx.ReadTimeout("Injected timeout", request=request)
+        if self.error_rate and self.random.random() < self.error_rate:
+            return httpx.Response(self.error_status, request=request)
+
+        fixture = self.match(str(request.url))
+        return httpx.Response(fixture.status_code, headers=fixture.headers, content=fixture.body, request=request)
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """
+    Pass requests through `transport` and save every response into a fixture directory readable by
+    `ReplayTransport.from_directory`.
+    """
+
+    recorded_headers = ("content-type", "location", "retry-after")
+    dropped_headers = {"content-encoding", "content-length", "transfer-encoding"}  # body is already decoded
+
+    def __init__(self, root: str, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.root = root
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self.manifest = []
+        os.makedirs(root, exist_ok=True)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        resp = await self.transport.handle_async_request(request)
+        body = await resp.aread()
+
+        file = f"{len(self.manifest):04d}.html"
+        with open(os.path.join(self.root, file), "wb") as f:
+            f.write(body)
+        self.manifest.append({
+            "url": f"^{re.escape(str(request.url))}$",
+            "status_code": resp.status_code,
+            "headers": {k: v for k in self.recorded_headers if (v := resp.headers.get(k)) is not None},
+            "file": file,
+        })
+        self.save()
+
+        headers = [(k, v) for k, v in resp.headers.multi_items() if k.lower() not in self.dropped_headers]
+        return httpx.Response(resp.status_code, headers=headers, content=body, request=request)
+
+    def save(self):
+        with open(os.path.join(self.root, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+
+    async def aclose(self):
+        await self.transport.aclose()
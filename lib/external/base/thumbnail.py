@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from concurrent.futures import Executor
+from io import BytesIO
+from typing import Iterable, List, Optional, Tuple
+
+import httpx
+from PIL.Image import Image, open as image_open
+
+__all__ = ["Thumbnail", "ThumbnailStore"]
+
+
+class Thumbnail:
+    """
+    Lazy handle of a cover image, either stored on disk or held as encoded bytes. Nothing is decoded until
+    `open` is called.
+    """
+
+    def __init__(self, path: Optional[str] = None, data: Optional[bytes] = None, digest: Optional[str] = None):
+        assert (path is None) != (data is None)
+        self.path = path
+        self.data = data
+        self.digest = digest
+
+    def __repr__(self):
+        return f"Thumbnail({self.path or f'<{len(self.data)} bytes>'})"
+
+    def read_bytes(self) -> bytes:
+        if self.data is not None:
+            return self.data
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def open(self, size: Optional[Tuple[int, int]] = None) -> Image:
+        """
+
+        Args:
+            size: Tuple[int, int], optional
+                max (width, height). JPEG covers are downscaled while decoding, which is much cheaper
+                than decoding at full size
+
+        Returns:
+
+        """
+
+        image = image_open(self.path if self.data is None else BytesIO(self.data))
+        if size is not None:
+            image.draft("RGB", size)
+            image.thumbnail(size)
+        return image
+
+
+def _resize(src: str, dst: str, size: Tuple[int, int], quality: int) -> str:
+    image = Thumbnail(path=src).open(size)
+    if image.mode not in {"RGB", "L"}:
+        image = image.convert("RGB")
+
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    image.save(tmp, "JPEG", quality=quality)
+    os.replace(tmp, dst)
+    return dst
+
+
+class ThumbnailStore:
+    """
+    Content-addressed store of cover images on disk.
+
+    Layout:
+        {root}/objects/{digest[:2]}/{digest}    image bytes, named by sha256 of content
+        {root}/refs/{sha1 of url}               digest of the image downloaded from url
+        {root}/gallery/{w}x{h}/{digest}.jpg     resized copies made by `make_gallery`
+
+    Identical images fetched from different urls or sources are stored once.
+    """
+
+    def __init__(self, root: str, chunk_size: int = 64 * 1024):
+        self.root = root
+        self.chunk_size = chunk_size
+        for name in ("objects", "refs", "tmp"):
+            os.makedirs(os.path.join(root, name), exist_ok=True)
+
+    def path_of(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def _path_of_ref(self, url: str) -> str:
+        return os.path.join(self.root, "refs", hashlib.sha1(url.encode()).hexdigest())
+
+    def get(self, url: str) -> Optional[Thumbnail]:
+        """
+        Thumbnail previously downloaded from `url`, or None.
+        """
+
+        try:
+            with open(self._path_of_ref(url)) as f:
+                digest = f.read().strip()
+        except FileNotFoundError:
+            return None
+
+        if not os.path.exists(path := self.path_of(digest)):
+            return None
+        return Thumbnail(path=path, digest=digest)
+
+    def _write_ref(self, url: str, digest: str):
+        fd, tmp = tempfile.mkstemp(dir=os.path.join(self.root, "tmp"))
+        with os.fdopen(fd, "w") as f:
+            f.write(digest)
+        os.replace(tmp, self._path_of_ref(url))
+
+    async def fetch(self, session: httpx.AsyncClient, url: str, **kwargs) -> Optional[Thumbnail]:
+        """
+        Stream the image at `url` into the store, skipped if it was downloaded before.
+
+        Args:
+            session: httpx.AsyncClient
+            url: str
+            **kwargs:
+                passed to `session.stream`
+
+        Returns:
+            Optional[Thumbnail]
+                None if the image is not available
+        """
+
+        if (thumbnail := self.get(url)) is not None:
+            return thumbnail
+
+        hasher = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=os.path.join(self.root, "tmp"))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async with session.stream("GET", url, **kwargs) as resp:
+                    if resp.status_code != 200:
+                        return None
+                    async for chunk in resp.aiter_bytes(self.chunk_size):
+                        hasher.update(chunk)
+                        f.write(chunk)
+
+            digest = hasher.hexdigest()
+            if not os.path.exists(path := self.path_of(digest)):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+        self._write_ref(url, digest)
+        return Thumbnail(path=path, digest=digest)
+
+    async def make_gallery(
+            self,
+            thumbnails: Iterable[Thumbnail],
+            size: Tuple[int, int] = (320, 320),
+            quality: int = 85,
+            executor: Optional[Executor] = None,
+    ) -> List[Optional[str]]:
+        """
+        Resize stored thumbnails to JPEG files of at most `size`, existing ones are reused.
+
+        Args:
+            thumbnails: Iterable[Thumbnail]
+                thumbnails of this store, in-memory ones are skipped
+            size: Tuple[int, int]
+            quality: int
+                JPEG quality
+            executor: Executor, optional
+                e.g. a `ProcessPoolExecutor` to resize in parallel without blocking the event loop. The
+                default executor of the loop is used if not given
+
+        Returns:
+            List[Optional[str]]
+                paths of resized images in the same order of `thumbnails`, None for skipped ones
+        """
+
+        loop = asyncio.get_running_loop()
+        gallery = os.path.join(self.root, "gallery", f"{size[0]}x{size[1]}")
+        os.makedirs(gallery, exist_ok=True)
+
+        async def resize(src: str, dst: str) -> str:
+            if os.path.exists(dst):
+                return dst
+            return await loop.run_in_executor(executor, _resize, src, dst, size, quality)
+
+        tasks, res = {}, []
+        for thumbnail in thumbnails:
+            if thumbnail.path is None:
+                res.append(None)
+                continue
+            dst = os.path.join(gallery, f"{thumbnail.digest or os.path.basename(thumbnail.path)}.jpg")
+            if dst not in tasks:  # the same image shared by several titles is resized once
+                tasks[dst] = asyncio.ensure_future(resize(thumbnail.path, dst))
+            res.append(tasks[dst])
+
+        await asyncio.gather(*tasks.values())
+        return [None if task is None else task.result() for task in res]
@@ -0,0 +1,241 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Dict, FrozenSet, Optional
+
+import httpx
+
+__all__ = ["TransportConfig", "TokenBucket", "HostThrottle", "ThrottledTransport"]
+
+
+@dataclass
+class TransportConfig:
+    """
+    Args:
+        rate: float, optional
+            requests per second allowed for each host, None for unlimited
+        burst: int
+            max number of requests sent at once after being idle
+        host_rates: Dict[str, float]
+            rate by host, overriding `rate`. e.g. {"www.javlibrary.com": 1.0}
+        max_connections_per_host: int
+            max concurrent requests in flight to a single host
+        max_connections: int
+        max_keepalive_connections: int
+        keepalive_expiry: float
+            seconds to keep an idle connection in pool
+        http2: bool
+            requires `h2` to be installed
+        timeout: float
+        max_retries: int
+            retries on `retry_statuses` or timeout, only for idempotent methods
+        backoff_base: float
+        backoff_max: float
+            exponential backoff with full jitter, i.e. uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+        retry_after_max: float
+            max seconds to honor a Retry-After header, a longer one gives up retrying
+        retry_statuses: FrozenSet[int]
+    """
+
+    rate: Optional[float] = 5.0
+    burst: int = 5
+    host_rates: Dict[str, float] = field(default_factory=dict)
+    max_connections_per_host: int = 8
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    timeout: float = 15.0
+    max_retries: int = 3
+    backoff_base: float = 0.5
+    backoff_max: float = 30.0
+    retry_after_max: float = 300.0
+    retry_statuses: FrozenSet[int] = frozenset({429, 500, 502, 503, 504})
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """
+        Hold back every following request for `seconds`, e.g. when the host answers with Retry-After.
+        """
+
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:  # serve waiters in order
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class HostThrottle:
+    """
+    Rate limit and concurrency cap of each host, shared by all transports of a session.
+    """
+
+    def __init__(self, config: TransportConfig):
+        self.config = config
+        self._buckets: Dict[str, Optional[TokenBucket]] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def bucket(self, host: str) -> Optional[TokenBucket]:
+        if host not in self._buckets:
+            rate = self.config.host_rates.get(host, self.config.rate)
+            self._buckets[host] = TokenBucket(rate, self.config.burst) if rate else None
+        return self._buckets[host]
+
+    def semaphore(self, host: str) -> asyncio.Semaphore:
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.config.max_connections_per_host)
+        return self._semaphores[host]
+
+    def pause(self, host: str, seconds: float):
+        if (bucket := self.bucket(host)) is not None:
+            bucket.pause(seconds)
+
+
+class _SlotReleasingStream(httpx.AsyncByteStream):
+    """
+    Keep the host slot taken until the response body is consumed or closed.
+    """
+
+    def __init__(self, stream: httpx.AsyncByteStream, semaphore: asyncio.Semaphore):
+        self.stream = stream
+        self.semaphore = semaphore
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self.semaphore.release()
+
+
+class ThrottledTransport(httpx.AsyncBaseTransport):
+    """
+    Pooled HTTP transport with per host token-bucket rate limit, per host concurrency cap and retry with
+    exponential backoff on `TransportConfig.retry_statuses` and timeouts, honoring Retry-After.
+    """
+
+    idempotent_methods = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+    def __init__(
+            self,
+            config: TransportConfig,
+            throttle: Optional[HostThrottle] = None,
+            proxy: Optional[str] = None,
+            transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        """
+
+        Args:
+            config: TransportConfig
+            throttle: HostThrottle, optional
+                per host state to share with other transports
+            proxy: str, optional
+            transport: httpx.AsyncBaseTransport, optional
+                underlying transport, e.g. a `ReplayTransport`. A pooled `httpx.AsyncHTTPTransport` if not given
+        """
+
+        self.config = config
+        self.throttle = throttle or HostThrottle(config)
+        self.transport = transport or httpx.AsyncHTTPTransport(
+            http2=config.http2,
+            limits=config.limits,
+            proxy=httpx.Proxy(proxy) if proxy else None,
+        )
+
+    @staticmethod
+    def retry_after(resp: httpx.Response) -> Optional[float]:
+        if (value := resp.headers.get("retry-after")) is None:
+            return None
+        if value.strip().isdigit():
+            return float(value)
+        try:
+            return max(0., parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    async def _send(self, request: httpx.Request, host: str) -> httpx.Response:
+        semaphore = self.throttle.semaphore(host)
+        await semaphore.acquire()
+        try:
+            if (bucket := self.throttle.bucket(host)) is not None:
+                await bucket.acquire()
+            resp = await self.transport.handle_async_request(request)
+        except BaseException:
+            semaphore.release()
+            raise
+
+        return httpx.Response(
+            status_code=resp.status_code,
+            headers=resp.headers,
+            stream=_SlotReleasingStream(resp.stream, semaphore),
+            extensions=resp.extensions,
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        max_retries = self.config.max_retries if request.method in self.idempotent_methods else 0
+
+        attempt = 0
+        while True:
+            try:
+                resp = await self._send(request, host)
+            except httpx.TimeoutException:
+                if attempt >= max_retries:
+                    raise
+                delay = self.config.backoff(attempt)
+            else:
+                if resp.status_code not in self.config.retry_statuses or attempt >= max_retries:
+                    return resp
+
+                if (delay := self.retry_after(resp)) is not None:
+                    if delay > self.config.retry_after_max:
+                        return resp
+                    self.throttle.pause(host, delay)
+                else:
+                    delay = self.config.backoff(attempt)
+                await resp.aclose()
+
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,64 @@
+import sqlite3
+import time
+from typing import Iterable, Optional, Tuple
+
+__all__ = ["UrlIndex"]
+
+
+class UrlIndex:
+    """
+    Map of regularized serial number to the detail url (or video id) of each source, so that a lookup can skip
+    the search request. Kept in a SQLite file, or in memory with the default path.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS url_index ("
+            "source TEXT NOT NULL, serial_no_reg TEXT NOT NULL, url TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (source, serial_no_reg))"
+        )
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM url_index").fetchone()[0]
+
+    def get(self, source: str, serial_no_reg: str) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT url FROM url_index WHERE source = ? AND serial_no_reg = ?", (source, serial_no_reg)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def put_many(self, source: str, items: Iterable[Tuple[str, str]]) -> int:
+        """
+
+        Args:
+            source: str
+            items: Iterable[Tuple[str, str]]
+                (serial_no_reg, url)
+
+        Returns:
+            int
+                number of items written
+        """
+
+        now = time.time()
+        rows = [(source, serial_no_reg, url, now) for serial_no_reg, url in items]
+        self.conn.execute("BEGIN")
+        try:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO url_index (source, serial_no_reg, url, updated_at) VALUES (?, ?, ?, ?)", rows
+            )
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        return len(rows)
+
+    def delete(self, source: str, serial_no_reg: str):
+        self.conn.execute("DELETE FROM url_index WHERE source = ? AND serial_no_reg = ?", (source, serial_no_reg))
+
+    def close(self):
+        self.conn.close()
@@ -2,9 +2,9 @@ from io import BytesIO
 from typing import List, Optional
 
 from PIL import Image
-from lxml import etree
 
 from lib.external.base import BaseApi, JavInfo, JavRecord
+from lib.external.base.extractor import Extractor, Field, last
 
 __all__ = ["FC2Api"]
 
@@ -13,6 +13,21 @@ class FC2Api(BaseApi):
     source = "FC2"
     url_domain = "https://adult.contents.fc2.com"
 
+    extractor_detail = Extractor(
+        {
+            "header": Field("count(//div[@class='items_article_headerInfo'])"),
+            "title": Field("//div[@class='items_article_headerInfo']/h3/text()", last),  # sometimes there is also a tag
+            "publisher": Field("//div[@class='items_article_headerInfo']/ul//@href", last),
+            "publish_date": Field("//div[@class='items_article_headerInfo']//div[@class='items_article_Releasedate']//text()"),
+            "url_image": Field("//div[@class='items_article_MainitemThumb']//img/@src"),
+            "length": Field("//div[@class='items_article_MainitemThumb']//text()"),
+        },
+        anchors=(rb"class=[\"']items_article_headerInfo[\"']", rb"class=[\"']items_article_MainitemThumb[\"']"),
+    )
+
+    def supports(self, serial_no_reg: str) -> bool:
+        return serial_no_reg.startswith("FC2-PPV-")
+
     async def search_by_keyword(self, keyword: str, page_no=1) -> List[JavRecord]:
         raise NotImplementedError("Not implemented")
 
@@ -38,28 +53,29 @@ class FC2Api(BaseApi):
 
         """
 
-        if not serial_no_reg.startswith("FC2-PPV-"):
+        if not self.supports(serial_no_reg):
             return None
         api_url = f"{self.url_domain}/article/{serial_no_reg.split("-")[-1]}/"
         resp = await self._make_request(api_url, follow_redirects=False)
 
-        if resp.status_code != 200:
+        if resp.status_code == 429 or resp.is_server_error:
+            resp.raise_for_status()
+        if resp.status_code != 200:  # 404, or redirected away from a missing or removed article
             return None
 
-        et = etree.HTML(resp.text)
-        if len(res := et.xpath("//div[@class='items_article_headerInfo']")) == 0:
+        attrs = self.extractor_detail.extract(resp.content, resp.encoding)
+        if not attrs.get("header"):
             return None
 
-        et_header = res[0]
-        title = et_header.xpath("./h3/text()")[-1]  # sometimes there is also a tag
-        publisher = et_header.xpath("./ul//@href")[-1].strip("/").split("/")[-1]
-        publish_date = et_header.xpath(".//div[@class='items_article_Releasedate']//text()")[0].split(" : ")[-1]
+        title = attrs["title"]
+        publisher = attrs["publisher"].strip("/").split("/")[-1]
+        publish_date = attrs["publish_date"].split(" : ")[-1]
         publish_date = publish_date.replace("/", "-")
 
-        url_image = et.xpath("//div[@class='items_article_MainitemThumb']//img/@src")[0]
-        times = [int(x) for x in et.xpath("//div[@class='items_article_MainitemThumb']//text()")[0].split(":")][::-1]
+        url_image = attrs["url_image"]
+        times = [int(x) for x in attrs["length"].split(":")][::-1]
         length = sum((unit * v) for unit, v in zip(times, (1, 60, 3600), strict=False))
-        thumbnail = await self._make_request_image(f"https:{url_image}") if with_thumbnail else None
+        thumbnail = await self._make_request_thumbnail(f"https:{url_image}") if with_thumbnail else None
 
         jav = JavInfo(
             serial_no=serial_no_reg,
@@ -3,9 +3,9 @@ from io import BytesIO
 from typing import List, Optional
 
 from PIL import Image
-from lxml import etree
 
 from lib.external.base import BaseApi, JavInfo, JavRecord
+from lib.external.base.extractor import Extractor, Field, Records, Table, every, nth
 
 __all__ = ["JavLibraryApi"]
 
@@ -17,6 +17,37 @@ class JavLibraryApi(BaseApi):
 
     patt_video_id = re.compile(r"\./\?v=(.*)")
 
+    extractor_search = Extractor(
+        {
+            "records": Records(
+                ".//div[@class='videos']/div[@class='video']/a",
+                {"title": Field("@title"), "url": Field("@href")},
+            ),
+        },
+        anchors=(rb"class=[\"']videos[\"']",),
+    )
+    extractor_detail = Extractor(
+        {
+            "title": Field(".//div[@id='video_title']//a[@rel='bookmark']/text()"),
+            "url_thumbnail": Field(".//img[@id='video_jacket_img']/@src"),
+            "attrs": Table(
+                "//div[@id='video_info']/div",
+                "string(@id)",
+                {
+                    "video_id": ("video_id", Field(".//td/text()", nth(1))),
+                    "video_date": ("video_date", Field(".//td/text()", nth(1))),
+                    "video_length": ("video_length", Field(".//td/span/text()", default="0")),
+                    "video_director": ("video_director", Field(".//td//text()", nth(1), default="")),
+                    "video_maker": ("video_maker", Field(".//td//a/text()", default="")),
+                    "video_label": ("video_label", Field(".//td//a/text()", default="")),
+                    "video_cast": ("video_cast", Field(".//td//a/text()", every, default=[])),
+                },
+            ),
+        },
+        anchors=(rb"id=[\"']video_title[\"']", rb"id=[\"']video_jacket_img[\"']", rb"id=[\"']video_info[\"']"),
+        stop=rb"id=[\"']video_comments[\"']",
+    )
+
     def _get_video_detail(self, video_id):
         url_video_detail = f"{self.url_domain_lang}/?v={video_id}"
         return self._make_request(url_video_detail)
@@ -26,14 +57,13 @@ class JavLibraryApi(BaseApi):
         resp = await self._make_request(url_video_list, follow_redirects=False)
 
         if resp.status_code == 200:  # which means found multiple results by keyword
-            et_videos = etree.HTML(resp.text).xpath(".//div[@class='videos']/div[@class='video']/a")
             res = [
                 JavRecord(
-                    keyword=(serial_title := element.get("title").split(" ", maxsplit=1))[0],
+                    keyword=(serial_title := x["title"].split(" ", maxsplit=1))[0],
                     title=serial_title[1],
-                    url=self.patt_video_id.match(element.get("href")).group(1)
+                    url=self.patt_video_id.match(x["url"]).group(1)
                 )
-                for element in et_videos
+                for x in self.extractor_search.extract(resp.content, resp.encoding)["records"]
             ]
         elif resp.status_code == 302:  # which means found only one video and get redirected
             video_id = self.patt_video_id.match(resp.headers["location"]).group(1)
@@ -42,6 +72,8 @@ class JavLibraryApi(BaseApi):
             ]
         else:
             raise
+
+        self._index_records(res)
         return res
 
     async def get_video_detail(self, serial_no_reg, with_thumbnail=False) -> Optional[JavInfo]:
@@ -66,45 +98,38 @@ class JavLibraryApi(BaseApi):
 
         """
 
-        if len(records := await self.search_by_keyword(serial_no_reg)) == 0:
-            return None
-
-        record = records[0]
-        if record.keyword != serial_no_reg:
-            return None
-
-        resp_video_detail = await self._get_video_detail(record.url)
-
-        root = etree.HTML(resp_video_detail.text)
-        title = root.xpath(".//div[@id='video_title']//a[@rel='bookmark']/text()")[0]
-
-        et_video_infos = root.xpath("//div[@id='video_info']/div")
-        attrs = {}
-        for element in et_video_infos:
-            match (key := element.get("id")):
-                case "video_id" | "video_date":
-                    attrs[key] = element.xpath(".//td/text()")[1]
-                case "video_length":
-                    attrs[key] = element.xpath(".//td/span/text()")[0]
-                case "video_director":
-                    attrs[key] = element.xpath(".//td//text()")[1].strip("-")
-                case "video_maker" | "video_label":
-                    attrs[key] = element.xpath(".//td//a/text()")[0]
-                case "video_cast":
-                    attrs[key] = self.strip_all(element.xpath(".//td//a/text()"))
-
-        url_thumbnail = root.xpath(".//img[@id='video_jacket_img']/@src")[0]
+        resp_video_detail = None
+        if (video_id := self._lookup_url(serial_no_reg)) is not None:
+            if (resp_video_detail := await self._get_video_detail(video_id)).status_code in (404, 410):  # stale entry
+                self.url_index.delete(self.source, serial_no_reg)
+                resp_video_detail = None
+            else:  # keep the entry when the site fails
+                resp_video_detail.raise_for_status()
+
+        if resp_video_detail is None:
+            if len(records := await self.search_by_keyword(serial_no_reg)) == 0:
+                return None
+
+            record = records[0]
+            if record.keyword != serial_no_reg:
+                return None
+
+            resp_video_detail = await self._get_video_detail(record.url)
+
+        attrs = self.extractor_detail.extract(resp_video_detail.content, resp_video_detail.encoding)
+        title = attrs["title"]
+        url_thumbnail = attrs["url_thumbnail"]
         if not url_thumbnail.startswith("https:"):
             url_thumbnail = f"https:{url_thumbnail}"
-        thumbnail = await self._make_request_image(url_thumbnail) if with_thumbnail else None
+        thumbnail = await self._make_request_thumbnail(url_thumbnail) if with_thumbnail else None
 
         jav = JavInfo(
             serial_no=attrs["video_id"],
             title=title,
-            casts=sorted(attrs["video_cast"]),
+            casts=sorted(self.strip_all(attrs.get("video_cast", []))),
             publish_date=attrs["video_date"],
             thumbnail=thumbnail,
-            length=attrs["video_length"] * 60,
+            length=int(attrs.get("video_length", 0)) * 60,
             maker=attrs["video_maker"].upper(),
             publisher=attrs["video_label"].upper(),
             source=self.source,
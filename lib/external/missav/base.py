@@ -1,14 +1,29 @@
 from io import BytesIO
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from PIL import Image
-from lxml import etree
 
 from lib.external.base import BaseApi, JavInfo, JavRecord
+from lib.external.base.extractor import Extractor, Field, Records, Table
 
 __all__ = ['MissAvApi']
 
 
+def _make_extractor_detail(keys: Dict[str, str]) -> Extractor:
+    return Extractor(
+        {
+            "title_gen": Field("//div[@class='mt-4']/h1/text()", default=""),
+            "info": Table(
+                "//div[@class='space-y-2']/div",
+                "string(./*[1])",
+                {label: (name, Field("./*[2]/text()")) for name, label in keys.items()},
+                match=lambda label, key: label[:-1] == key,  # strip the trailing colon
+            ),
+        },
+        anchors=(rb"class=[\"']mt-4[\"']", rb"class=[\"']space-y-2[\"']"),
+    )
+
+
 class MissAvApi(BaseApi):
     source = "MissAV"
     url_domain = "https://missav.com"
@@ -39,10 +54,28 @@ class MissAvApi(BaseApi):
         },
     }
 
+    extractor_search = Extractor(
+        {
+            "records": Records(
+                "//div[@x-data]/div/div/div[@class='my-2 text-sm text-nord4 truncate']/a",
+                {"keyword": Field("@alt"), "title": Field("./text()", default=""), "url": Field("@href")},
+            ),
+        },
+        anchors=(rb"x-data=",),
+    )
+    extractor_detail = {lang: _make_extractor_detail(keys) for lang, keys in _keys.items()}
+
     @property
     def keys(self):
         return self._keys[self.lang]
 
+    def supports(self, serial_no_reg: str) -> bool:
+        return True  # MissAV also hosts FC2 titles
+
+    @staticmethod
+    def url_cover(serial_no_reg: str) -> str:
+        return f"https://eightcha.com/{serial_no_reg.lower()}/cover.jpg"
+
     async def get_video_screenshot(self, serial_no_reg: str) -> Image.Image:
         """
 
@@ -54,22 +87,16 @@ class MissAvApi(BaseApi):
 
         """
 
-        url = f"https://eightcha.com/{serial_no_reg.lower()}/cover.jpg"
-        return await self._make_request_image(url)
+        return await self._make_request_image(self.url_cover(serial_no_reg))
 
     async def search_by_keyword(self, keyword, page_no=1) -> List[JavRecord]:
         url = f"{self.url_domain_lang}/search/{keyword}?page={page_no}"
         resp = await self._make_request(url)
-
-        elements = etree.HTML(resp.text).xpath(
-            "//div[@x-data]/div/div/div[@class='my-2 text-sm text-nord4 truncate']/a")
+        resp.raise_for_status()
 
         records = [
-            JavRecord(
-                keyword=element.get("alt"),
-                title=element.text.strip(),
-                url=element.get("href")
-            ) for element in elements
+            JavRecord(keyword=x["keyword"], title=x["title"].strip(), url=x["url"])
+            for x in self.extractor_search.extract(resp.content, resp.encoding)["records"]
         ]
 
         return records
@@ -97,25 +124,23 @@ class MissAvApi(BaseApi):
         resp = await self._make_request(url_video_detail, follow_redirects=True)
         if resp.status_code == 404:
             return None
+        resp.raise_for_status()
 
-        elements = (et := etree.HTML(resp.text)).xpath("//div[@class='space-y-2']/div")
-        tmp = {
-            (kvs := element.xpath("./*"))[0].text[:-1]: kvs[1].text for element in elements
-        }
+        tmp = self.extractor_detail[self.lang].extract(resp.content, resp.encoding)
 
         # this title will change accordingly with language
-        title_gen = et.xpath("//div[@class='mt-4']/h1/text()")[0].replace("\u3000", " ")
-        if len(casts := self.strip_all(tmp.get(self.keys["casts"], "").split(", "), drop_empty_str=True)) > 0:
+        title_gen = tmp["title_gen"].replace("\u3000", " ")
+        if len(casts := self.strip_all((tmp.get("casts") or "").split(", "), drop_empty_str=True)) > 0:
             casts = (cast.split()[-1].strip("()") for cast in casts)
             casts = self.strip_all(casts, drop_empty_str=True)
 
         jav = JavInfo(
-            serial_no=tmp[self.keys["serial_no"]],
-            title=tmp.get(self.keys["title"], title_gen),  # FC2 prefer to use the title
+            serial_no=tmp["serial_no"],
+            title=tmp.get("title", title_gen),  # FC2 prefer to use the title
             casts=sorted(casts),
-            publish_date=tmp[self.keys["publish_date"]],
-            thumbnail=(await self.get_video_screenshot(serial_no_reg)) if with_thumbnail else None,
-            maker=tmp.get(self.keys["maker"], "").upper(),
+            publish_date=tmp["publish_date"],
+            thumbnail=(await self._make_request_thumbnail(self.url_cover(serial_no_reg))) if with_thumbnail else None,
+            maker=(tmp.get("maker") or "").upper(),
             source=self.source,
         )
         return jav
@@ -0,0 +1 @@
+from .base import ResolveError, Resolver, ResolverClient
@@ -0,0 +1,229 @@
+import asyncio
+from typing import Dict, Iterable, List, Optional, Sequence, Type, Union
+
+from lib.external.base import BaseApi, BaseClient, JavInfo, ThumbnailStore, UrlIndex
+from lib.external.fc2 import FC2Api
+from lib.external.javlibrary import JavLibraryApi
+from lib.external.missav import MissAvApi
+from lib.external.tokyolib import TokyoLibApi
+
+__all__ = ["ResolveError", "Resolver", "ResolverClient"]
+
+
+class ResolveError(Exception):
+    """
+    Raised when a serial number was found by no source and at least one source failed (timeout, network or http
+    error, unexpected page...), so that it can not be told apart from a serial number no source knows.
+    """
+
+    def __init__(self, serial_no_reg: str, errors: Dict[str, BaseException]):
+        """
+
+        Args:
+            serial_no_reg: str
+            errors: Dict[str, BaseException]
+                {`BaseApi.source`: exception}
+        """
+
+        super().__init__(
+            f"{serial_no_reg}: " + "; ".join(f"{source}: {e!r}" for source, e in errors.items())
+        )
+        self.serial_no_reg = serial_no_reg
+        self.errors = errors
+
+
+class Resolver:
+    """
+    Query every applicable source of a serial number concurrently.
+
+    Policies:
+        - first: the first source returning a result wins, the others are cancelled
+        - merge: wait for all sources (or their deadlines) and merge fields by order of `apis`
+
+    A source returning None is a definitive miss. A source raising or missing its deadline failed: it does not stop
+    other sources from answering, but when nothing is found a `ResolveError` is raised instead of returning None.
+    """
+
+    policies = {"first", "merge"}
+
+    def __init__(
+            self,
+            apis: Sequence[BaseApi],
+            policy: str = "first",
+            timeout: float = 15.0,
+            timeouts: Optional[Dict[str, float]] = None,
+            concurrency: int = 16,
+    ):
+        """
+
+        Args:
+            apis: Sequence[BaseApi]
+                sources to query, ordered by precedence
+            policy: str, optional {"first", "merge"}
+            timeout: float
+                default deadline in seconds of a single source
+            timeouts: Dict[str, float], optional
+                deadline by `BaseApi.source`, overriding `timeout`
+            concurrency: int
+                max number of serial numbers resolved at the same time by `resolve_many`
+        """
+
+        assert policy in self.policies
+        self.apis = list(apis)
+        self.policy = policy
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self.concurrency = concurrency
+
+    def applicable_apis(self, serial_no_reg: str) -> List[BaseApi]:
+        return [api for api in self.apis if api.supports(serial_no_reg)]
+
+    async def _query(
+            self, api: BaseApi, serial_no_reg: str, with_thumbnail: bool
+    ) -> Union[JavInfo, None, Exception]:
+        """
+        Returns:
+            the result of `api`, or the exception it failed with, so that other sources may still answer
+        """
+
+        try:
+            return await asyncio.wait_for(
+                api.get_video_detail(serial_no_reg, with_thumbnail=with_thumbnail),
+                self.timeouts.get(api.source, self.timeout),
+            )
+        except Exception as e:
+            return e
+
+    @staticmethod
+    async def _resolve_first(tasks: List[asyncio.Task]) -> Optional[JavInfo]:
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in (t for t in tasks if t in done):  # keep precedence among simultaneous results
+                    if isinstance(res := task.result(), JavInfo):
+                        return res
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    @staticmethod
+    async def _resolve_merge(tasks: List[asyncio.Task]) -> Optional[JavInfo]:
+        if len(res := [x for x in await asyncio.gather(*tasks) if isinstance(x, JavInfo)]) == 0:
+            return None
+        return res[0].merge(*res[1:])
+
+    async def resolve(self, serial_no_reg: str, with_thumbnail=False, policy: Optional[str] = None) -> Optional[JavInfo]:
+        """
+        Args:
+            serial_no_reg: str
+                regularized serial number
+            with_thumbnail: bool
+                whether to download thumbnail of cover
+            policy: str, optional {"first", "merge"}
+                overrides the policy of resolver
+
+        Returns:
+            Optional[JavInfo]
+                None if every applicable source answered that it does not know the serial number
+
+        Raises:
+            ResolveError
+                nothing was found and some sources failed
+        """
+
+        policy = policy or self.policy
+        assert policy in self.policies
+
+        apis = self.applicable_apis(serial_no_reg)
+        tasks = [asyncio.create_task(self._query(api, serial_no_reg, with_thumbnail)) for api in apis]
+        if len(tasks) == 0:
+            return None
+
+        try:
+            if policy == "first":
+                res = await self._resolve_first(tasks)
+            else:
+                res = await self._resolve_merge(tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if res is None:  # every task is done here
+            errors = {api.source: e for api, task in zip(apis, tasks) if isinstance(e := task.result(), Exception)}
+            if len(errors) > 0:
+                raise ResolveError(serial_no_reg, errors)
+        return res
+
+    async def resolve_many(
+            self,
+            serial_nos_reg: Iterable[str],
+            with_thumbnail=False,
+            policy: Optional[str] = None,
+            concurrency: Optional[int] = None,
+    ) -> Dict[str, Union[JavInfo, None, ResolveError]]:
+        """
+        Resolve a batch of serial numbers with at most `concurrency` of them in flight, so that the number of
+        open connections stays bounded by `concurrency` * number of sources no matter the size of the batch.
+        A failed serial number does not stop the batch, its `ResolveError` is returned in place of the result.
+
+        Args:
+            serial_nos_reg: Iterable[str]
+                regularized serial numbers, consumed lazily. Duplicates are resolved once
+            with_thumbnail: bool
+                whether to download thumbnail of cover
+            policy: str, optional {"first", "merge"}
+            concurrency: int, optional
+                overrides the concurrency of resolver
+
+        Returns:
+            Dict[str, Union[JavInfo, None, ResolveError]]
+        """
+
+        serial_nos_reg = iter(serial_nos_reg)
+        results = {}
+
+        async def worker():
+            for serial_no_reg in serial_nos_reg:
+                if serial_no_reg in results:
+                    continue
+                results[serial_no_reg] = None  # claim it before awaiting, so that other workers skip it
+                try:
+                    results[serial_no_reg] = await self.resolve(serial_no_reg, with_thumbnail, policy)
+                except ResolveError as e:
+                    results[serial_no_reg] = e
+
+        await asyncio.gather(*(worker() for _ in range(concurrency or self.concurrency)))
+        return results
+
+
+class ResolverClient(BaseClient):
+    api_classes: Sequence[Type[BaseApi]] = (MissAvApi, JavLibraryApi, TokyoLibApi, FC2Api)
+
+    def __init__(
+            self,
+            policy: str = "first",
+            timeout: float = 15.0,
+            timeouts: Optional[Dict[str, float]] = None,
+            concurrency: int = 16,
+            thumbnail_store: Optional[ThumbnailStore] = None,
+            url_index: Optional[UrlIndex] = None,
+            **session_args,
+    ):
+        super().__init__(**session_args)
+        self.apis = [api_class(self.session, thumbnail_store, url_index) for api_class in self.api_classes]
+        self.resolver = Resolver(self.apis, policy, timeout, timeouts, concurrency)
+
+    async def resolve(self, serial_no_reg: str, with_thumbnail=False, policy: Optional[str] = None):
+        return await self.resolver.resolve(serial_no_reg, with_thumbnail, policy)
+
+    async def resolve_many(
+            self,
+            serial_nos_reg: Iterable[str],
+            with_thumbnail=False,
+            policy: Optional[str] = None,
+            concurrency: Optional[int] = None,
+    ):
+        return await self.resolver.resolve_many(serial_nos_reg, with_thumbnail, policy, concurrency)
@@ -1,8 +1,7 @@
 from typing import List, Optional
 
-from lxml import etree
-
 from lib.external.base import BaseApi, JavInfo, JavRecord
+from lib.external.base.extractor import Extractor, Field, Records, Table, every
 
 __all__ = ['TokyoLibApi']
 
@@ -11,12 +10,47 @@ class TokyoLibApi(BaseApi):
     source = "TokyoLib"
     url_domain = "https://tokyolib.com"
 
-    async def search_by_keyword(self, keyword, search_type="id") -> List[JavRecord]:
+    extractor_search = Extractor(
+        {
+            "records": Records(
+                "//div[@class='works']/a[@class='work']",
+                {
+                    "keyword": Field("./h4[@class='work-id']/text()"),
+                    "title": Field("./h4[@class='work-title']/text()"),
+                    "url": Field("@href"),
+                },
+            ),
+        },
+        anchors=(rb"class=[\"']works[\"']",),
+    )
+    extractor_detail = Extractor(
+        {
+            "title": Field("//h1[@class='title is-4']/text()"),
+            "casts": Field("//div[@class='info']//a[@class='actress']/text()", every, default=[]),
+            "attrs": Table(
+                "(//div[@class='info']//div[@class='attributes']/dl)[1]/dd",
+                "normalize-space(.)",
+                {
+                    "番号": ("serial_no", Field("./following-sibling::dt[1]/text()")),
+                    "发行时间": ("publish_date", Field("./following-sibling::dt[1]/text()")),
+                    "系列": ("serie", Field("./following-sibling::dt[1]//text()")),
+                    "片商": ("maker", Field("./following-sibling::dt[1]//text()")),
+                    "厂牌": ("publisher", Field("./following-sibling::dt[1]//text()")),
+                    "导演": ("director", Field("./following-sibling::dt[1]//text()")),
+                },
+                match=str.endswith,
+            ),
+        },
+        anchors=(rb"class=[\"']title is-4[\"']", rb"class=[\"']info[\"']"),
+    )
+
+    async def search_by_keyword(self, keyword, search_type="id", page_no=1) -> List[JavRecord]:
         """
 
         Args:
             keyword:
             search_type: str, optional {"id", "actress"}
+            page_no: int
 
         Returns:
 
@@ -26,19 +60,19 @@ class TokyoLibApi(BaseApi):
             raise NotImplementedError()
 
         url_video_detail = f"{self.url_domain}/search?type={search_type}&q={keyword}"
+        if page_no > 1:
+            url_video_detail = f"{url_video_detail}&page={page_no}"
         resp = await self._make_request(url_video_detail)
+        resp.raise_for_status()
 
-        elements = etree.HTML(resp.text).xpath("//div[@class='works']/a[@class='work']")
         records = [
-            JavRecord(
-                keyword=element.xpath("./h4[@class='work-id']/text()")[0],
-                title=element.xpath("./h4[@class='work-title']/text()")[0],
-                url=f"{self.url_domain}{element.get('href')}",
-            ) for element in elements
+            JavRecord(keyword=x["keyword"], title=x["title"], url=f"{self.url_domain}{x['url']}")
+            for x in self.extractor_search.extract(resp.content, resp.encoding)["records"]
         ]
+        self._index_records(records)
         return records
 
-    async def get_video_detail(self, serial_no_reg: str) -> Optional[JavInfo]:
+    async def get_video_detail(self, serial_no_reg: str, with_thumbnail=False) -> Optional[JavInfo]:
         """
         Fetch meta info of JAV, supported fields:
             - serial_no
@@ -53,37 +87,36 @@ class TokyoLibApi(BaseApi):
         Args:
             serial_no_reg: str
                 regularized serial number
+            with_thumbnail: bool
+                unused, TokyoLib provides no cover. Kept for a uniform signature across sources
 
         Returns:
 
         """
 
-        if len(records := await self.search_by_keyword(serial_no_reg)) == 0:
-            return None
-
-        resp = await self._make_request(records[0].url)
-
-        et = etree.HTML(resp.text)
-        et_info = et.xpath("//div[@class='info']")[0]
-
-        et_attrs = et_info.xpath(".//div[@class='attributes']/dl")[0]
-        attrs = {}
-        for key, et_value in zip(et_attrs.xpath("./dd/text()"), et_attrs.xpath("./dt")):
-            if key.endswith("番号"):
-                attrs["serial_no"] = et_value.xpath("./text()")[0].split()[0].upper()
-            elif key.endswith("发行时间"):
-                attrs["publish_date"] = et_value.xpath("./text()")[0].split()[0].upper()
-            elif key.endswith("系列"):
-                attrs["serie"] = et_value.xpath(".//text()")[0].strip()
-            elif key.endswith("片商"):
-                attrs["maker"] = et_value.xpath(".//text()")[0].strip()
-            elif key.endswith("厂牌"):
-                attrs["publisher"] = et_value.xpath(".//text()")[0].strip()
-            elif key.endswith("导演"):
-                attrs["director"] = et_value.xpath(".//text()")[0].strip()
-
-        title = et.xpath("//h1[@class='title is-4']/text()")[0]
-        casts = sorted(self.strip_all(et_info.xpath(".//a[@class='actress']/text()"), drop_empty_str=True))
+        resp = None
+        if (url := self._lookup_url(serial_no_reg)) is not None:
+            if (resp := await self._make_request(url)).status_code in (404, 410):  # stale entry
+                self.url_index.delete(self.source, serial_no_reg)
+                resp = None
+            else:  # keep the entry when the site fails
+                resp.raise_for_status()
+
+        if resp is None:
+            if len(records := await self.search_by_keyword(serial_no_reg)) == 0:
+                return None
+
+            resp = await self._make_request(records[0].url)
+            resp.raise_for_status()
+
+        attrs = self.extractor_detail.extract(resp.content, resp.encoding)
+        for key in ("serial_no", "publish_date"):
+            attrs[key] = attrs[key].split()[0].upper()
+        for key in ("serie", "maker", "publisher", "director"):
+            attrs[key] = (attrs.get(key) or "").strip()
+
+        title = attrs["title"]
+        casts = sorted(self.strip_all(attrs["casts"], drop_empty_str=True))
 
         jav = JavInfo(
             serial_no=attrs["serial_no"],
@@ -93,7 +126,7 @@ class TokyoLibApi(BaseApi):
             thumbnail=None,
             publisher=attrs["publisher"].upper(),
             maker=attrs["maker"].upper(),  # not sure if it's correct
-            director=attrs.get("director", ""),
+            director=attrs["director"],
             source=self.source,
         )
         return jav
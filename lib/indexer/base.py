@@ -0,0 +1,285 @@
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+from lib.external.base import JavInfo, SerialNoParser
+from lib.external.resolver import ResolveError, Resolver
+
+__all__ = ["CatalogEntry", "LibraryIndexer"]
+
+
+class CatalogEntry:
+    """
+    Compact row of the catalog: a file and the meta info resolved for its serial number.
+    """
+
+    __slots__ = (
+        "path", "size", "mtime_ns", "serial_no_reg", "source",
+        "serial_no", "title", "casts", "publish_date", "length", "maker", "publisher", "director", "thumbnail",
+    )
+
+    def __init__(
+            self,
+            path: str,
+            size: int,
+            mtime_ns: int,
+            serial_no_reg: Optional[str] = None,
+            info: Optional[dict] = None,
+    ):
+        """
+
+        Args:
+            path: str
+            size: int
+            mtime_ns: int
+            serial_no_reg: str, optional
+            info: dict, optional
+                `JavInfo.to_dict` of the resolved info
+        """
+
+        self.path, self.size, self.mtime_ns, self.serial_no_reg = path, size, mtime_ns, serial_no_reg
+
+        info = info or {}
+        self.source = info.get("source", "")
+        self.serial_no = info.get("serial_no", "")
+        self.title = JavInfo.from_dict(info).title if info else ""  # without the serial number, as `JavInfo.title`
+        self.casts = info.get("casts", [])
+        self.publish_date = info.get("publish_date", "")
+        self.length = info.get("length", 0)
+        self.maker = info.get("maker", "")
+        self.publisher = info.get("publisher", "")
+        self.director = info.get("director", "")
+        self.thumbnail = info.get("thumbnail")
+
+    def __repr__(self):
+        return f"CatalogEntry({self.path!r}, {self.serial_no_reg!r}, {self.source!r})"
+
+    @property
+    def resolved(self) -> bool:
+        return self.source != ""
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def to_jav_info(self) -> JavInfo:
+        return JavInfo.from_dict({k: getattr(self, k) for k in (
+            "serial_no", "title", "casts", "publish_date", "length", "maker", "publisher", "director", "source",
+            "thumbnail",
+        )})
+
+
+class LibraryIndexer:
+    """
+    Incremental index of a media library in a SQLite file.
+
+    Each run only parses new or changed files and only resolves serial numbers without a known info, in chunks of
+    `checkpoint_every` which are committed one by one, so that an interrupted run resumes where it stopped.
+    Misses, i.e. serial numbers every applicable source answered not to know, are retried after
+    `retry_missing_after` seconds. Serial numbers whose lookup failed are not stored and stay pending.
+
+    Usage:
+        client = ResolverClient(url_index=UrlIndex("url_index.db"))
+        indexer = LibraryIndexer("library.db", client.resolver)
+        await indexer.refresh(["/mnt/nas/jav"])
+        indexer.export_jsonl("catalog.jsonl")
+    """
+
+    default_extensions = (".mp4", ".mkv", ".avi", ".wmv", ".mov", ".m4v", ".ts", ".rmvb", ".flv", ".iso")
+
+    def __init__(
+            self,
+            path: str,
+            resolver: Resolver,
+            extensions: Optional[Iterable[str]] = default_extensions,
+            checkpoint_every: int = 200,
+            retry_missing_after: Optional[float] = 7 * 86400,
+    ):
+        """
+
+        Args:
+            path: str
+                path of the SQLite file
+            resolver: Resolver
+            extensions: Iterable[str], optional
+                extensions of files to index, all files if None
+            checkpoint_every: int
+                number of serial numbers resolved and committed at once
+            retry_missing_after: float, optional
+                seconds before looking up a serial number not found by any source again, None for never
+        """
+
+        self.path = path
+        self.resolver = resolver
+        self.extensions = tuple(extensions) if extensions else None
+        self.checkpoint_every = checkpoint_every
+        self.retry_missing_after = retry_missing_after
+
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, serial_no_reg TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_files_serial_no_reg ON files (serial_no_reg)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS infos ("
+            "serial_no_reg TEXT PRIMARY KEY, info TEXT, resolved_at REAL NOT NULL)"  # info is NULL for misses
+        )
+
+    def close(self):
+        self.conn.close()
+
+    def _write(self, sql: str, rows: List[tuple]):
+        if len(rows) == 0:
+            return
+
+        self.conn.execute("BEGIN")
+        try:
+            self.conn.executemany(sql, rows)
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def scan(self, roots: Iterable[Union[str, os.PathLike]]) -> Dict[str, int]:
+        """
+        Sync the files table with the directory trees under `roots`, comparing size and mtime.
+
+        Returns:
+            Dict[str, int]
+                number of new, changed, removed and unchanged files
+        """
+
+        stats = {"new": 0, "changed": 0, "removed": 0, "unchanged": 0}
+        for root in roots:
+            root = os.path.abspath(os.fspath(root))
+            prefix = os.path.join(root, "")
+            known = {
+                path: (size, mtime_ns) for path, size, mtime_ns in self.conn.execute(
+                    "SELECT path, size, mtime_ns FROM files WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)
+                )
+            }
+
+            batch = []
+            for entry in SerialNoParser.iter_files(root, self.extensions):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+
+                if (old := known.pop(entry.path, None)) == (st.st_size, st.st_mtime_ns):
+                    stats["unchanged"] += 1
+                    continue
+
+                stats["new" if old is None else "changed"] += 1
+                batch.append((entry.path, entry.name, st.st_size, st.st_mtime_ns))
+                if len(batch) >= self.checkpoint_every:
+                    self._upsert_files(batch)
+                    batch = []
+            self._upsert_files(batch)
+
+            stats["removed"] += len(known)
+            self._write("DELETE FROM files WHERE path = ?", [(path,) for path in known])
+        return stats
+
+    def _upsert_files(self, batch: List[tuple]):
+        serial_nos_reg = SerialNoParser.parse_serial_nos(name for _, name, _, _ in batch)
+        self._write(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, serial_no_reg) VALUES (?, ?, ?, ?)",
+            [(path, size, mtime_ns, serial_no_reg)
+             for (path, _, size, mtime_ns), serial_no_reg in zip(batch, serial_nos_reg)],
+        )
+
+    def pending_serial_nos(self) -> List[str]:
+        """
+        Serial numbers of indexed files that were never resolved, or missed long enough ago.
+        """
+
+        retry_before = -1. if self.retry_missing_after is None else time.time() - self.retry_missing_after
+        rows = self.conn.execute(
+            "SELECT DISTINCT f.serial_no_reg FROM files f LEFT JOIN infos i ON f.serial_no_reg = i.serial_no_reg "
+            "WHERE f.serial_no_reg IS NOT NULL AND (i.serial_no_reg IS NULL OR (i.info IS NULL AND i.resolved_at < ?))",
+            (retry_before,),
+        )
+        return [row[0] for row in rows]
+
+    async def resolve_pending(self, with_thumbnail=False) -> Dict[str, int]:
+        """
+        Returns:
+            Dict[str, int]
+                number of resolved, missing and failed serial numbers
+        """
+
+        stats = {"resolved": 0, "missing": 0, "failed": 0}
+        pending = self.pending_serial_nos()
+        for i in range(0, len(pending), self.checkpoint_every):
+            results = await self.resolver.resolve_many(pending[i:i + self.checkpoint_every], with_thumbnail)
+
+            now, rows = time.time(), []
+            for serial_no_reg, jav in results.items():
+                if isinstance(jav, ResolveError):  # left pending for the next run
+                    stats["failed"] += 1
+                    continue
+                stats["missing" if jav is None else "resolved"] += 1
+                info = None if jav is None else json.dumps(jav.to_dict(), ensure_ascii=False)
+                rows.append((serial_no_reg, info, now))
+            self._write("INSERT OR REPLACE INTO infos (serial_no_reg, info, resolved_at) VALUES (?, ?, ?)", rows)
+        return stats
+
+    async def refresh(self, roots: Iterable[Union[str, os.PathLike]], with_thumbnail=False) -> Dict[str, int]:
+        """
+        Scan `roots` and resolve what is new.
+        """
+
+        return {**self.scan(roots), **(await self.resolve_pending(with_thumbnail))}
+
+    def iter_catalog(self) -> Iterator[CatalogEntry]:
+        rows = self.conn.execute(
+            "SELECT f.path, f.size, f.mtime_ns, f.serial_no_reg, i.info "
+            "FROM files f LEFT JOIN infos i ON f.serial_no_reg = i.serial_no_reg ORDER BY f.path"
+        )
+        for path, size, mtime_ns, serial_no_reg, info in rows:
+            yield CatalogEntry(path, size, mtime_ns, serial_no_reg, json.loads(info) if info else None)
+
+    def export_jsonl(self, path: str) -> int:
+        n = 0
+        with open(path, "w", encoding="utf-8") as f:
+            for entry in self.iter_catalog():
+                f.write(json.dumps(entry.to_dict(), ensure_ascii=False))
+                f.write("\n")
+                n += 1
+        return n
+
+    def export_parquet(self, path: str, batch_size: int = 10_000) -> int:
+        """
+        Requires `pyarrow`.
+        """
+
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("pyarrow is required to export parquet") from e
+
+        schema = pa.schema([
+            ("path", pa.string()), ("size", pa.int64()), ("mtime_ns", pa.int64()), ("serial_no_reg", pa.string()),
+            ("source", pa.string()), ("serial_no", pa.string()), ("title", pa.string()),
+            ("casts", pa.list_(pa.string())), ("publish_date", pa.string()), ("length", pa.int64()),
+            ("maker", pa.string()), ("publisher", pa.string()), ("director", pa.string()), ("thumbnail", pa.string()),
+        ])
+
+        n = 0
+        with pq.ParquetWriter(path, schema) as writer:
+            batch = []
+            for entry in self.iter_catalog():
+                batch.append(entry.to_dict())
+                if len(batch) >= batch_size:
+                    writer.write_table(pa.Table.from_pylist(batch, schema))
+                    n, batch = n + len(batch), []
+            if len(batch) > 0:
+                writer.write_table(pa.Table.from_pylist(batch, schema))
+                n += len(batch)
+        return n
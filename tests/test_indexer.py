@@ -0,0 +1,165 @@
+"""
+Tests of `LibraryIndexer` on a temporary library, resolved through `Resolver` and `ReplayTransport` on the fixtures
+of `benchmarks/fixtures`.
+
+Usage:
+    python -m pytest tests
+"""
+
+import asyncio
+import json
+import os
+
+import httpx
+import pytest
+
+from lib.external.base import ReplayTransport
+from lib.external.fc2 import FC2Api
+from lib.external.javlibrary import JavLibraryApi
+from lib.external.missav import MissAvApi
+from lib.external.resolver import Resolver
+from lib.external.tokyolib import TokyoLibApi
+from lib.indexer import LibraryIndexer
+
+FIXTURES = os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks", "fixtures")
+FILES = ("ABC-123.mp4", "sub/[HD] abc123 part2.mkv", "sub/ZZZ-001.mp4", "random.mp4", "notes.txt")
+
+
+@pytest.fixture
+def library(tmp_path) -> str:
+    root = tmp_path / "library"
+    for name in FILES:
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_text(name)
+    return str(root)
+
+
+@pytest.fixture
+def replay() -> ReplayTransport:
+    return ReplayTransport.from_directory(FIXTURES)
+
+
+def indexer_run(path: str, transport: httpx.AsyncBaseTransport, func, **kwargs):
+    """
+    Call `func(indexer)` with an indexer resolving through `transport`.
+    """
+
+    async def main():
+        async with httpx.AsyncClient(transport=transport) as session:
+            resolver = Resolver([api_class(session) for api_class in (MissAvApi, JavLibraryApi, TokyoLibApi, FC2Api)])
+            indexer = LibraryIndexer(path, resolver, **kwargs)
+            try:
+                res = func(indexer)
+                return await res if asyncio.iscoroutine(res) else res
+            finally:
+                indexer.close()
+    return asyncio.run(main())
+
+
+def test_scan(tmp_path, library, replay):
+    path = str(tmp_path / "library.db")
+
+    stats = indexer_run(path, replay, lambda indexer: indexer.scan([library]))
+    assert stats == {"new": 4, "changed": 0, "removed": 0, "unchanged": 0}
+
+    stats = indexer_run(path, replay, lambda indexer: indexer.scan([library]))
+    assert stats == {"new": 0, "changed": 0, "removed": 0, "unchanged": 4}
+
+    with open(os.path.join(library, "ABC-123.mp4"), "a") as f:
+        f.write("more")
+    os.utime(os.path.join(library, "random.mp4"), ns=(0, 0))
+    os.remove(os.path.join(library, "sub/ZZZ-001.mp4"))
+    with open(os.path.join(library, "DEF-001.mkv"), "w") as f:
+        f.write("new")
+
+    stats = indexer_run(path, replay, lambda indexer: indexer.scan([library]))
+    assert stats == {"new": 1, "changed": 2, "removed": 1, "unchanged": 1}
+    assert replay.n_requests == 0
+
+
+def test_refresh_incremental(tmp_path, library, replay):
+    path = str(tmp_path / "library.db")
+
+    stats = indexer_run(path, replay, lambda indexer: indexer.refresh([library]))
+    assert (stats["resolved"], stats["missing"], stats["failed"]) == (1, 1, 0)
+
+    n_requests = replay.n_requests
+    stats = indexer_run(path, replay, lambda indexer: indexer.refresh([library]))
+    assert (stats["unchanged"], stats["resolved"], stats["missing"]) == (4, 0, 0)
+    assert replay.n_requests == n_requests
+
+
+def test_pending_retry_missing_after(tmp_path, library, replay):
+    path = str(tmp_path / "library.db")
+    indexer_run(path, replay, lambda indexer: indexer.refresh([library]))
+
+    for retry_missing_after, pending in ((3600., []), (None, []), (0., ["ZZZ-001"])):
+        res = indexer_run(path, replay, LibraryIndexer.pending_serial_nos, retry_missing_after=retry_missing_after)
+        assert res == pending
+
+
+def test_failed_stay_pending(tmp_path, library):
+    path = str(tmp_path / "library.db")
+    replay = ReplayTransport.from_directory(FIXTURES, error_rate=1.)
+
+    stats = indexer_run(path, replay, lambda indexer: indexer.refresh([library]))
+    assert (stats["resolved"], stats["missing"], stats["failed"]) == (0, 0, 2)
+    assert sorted(indexer_run(path, replay, LibraryIndexer.pending_serial_nos)) == ["ABC-123", "ZZZ-001"]
+
+    replay.error_rate = 0.
+    stats = indexer_run(path, replay, lambda indexer: indexer.refresh([library]))
+    assert (stats["resolved"], stats["missing"], stats["failed"]) == (1, 1, 0)
+    assert indexer_run(path, replay, LibraryIndexer.pending_serial_nos) == []
+
+
+def test_resume_after_interruption(tmp_path, library, replay):
+    path = str(tmp_path / "library.db")
+
+    async def interrupted(indexer):
+        resolve_many = indexer.resolver.resolve_many
+        calls = []
+
+        async def once(*args, **kwargs):
+            if len(calls) > 0:
+                raise RuntimeError("interrupted")
+            calls.append(args)
+            return await resolve_many(*args, **kwargs)
+
+        indexer.resolver.resolve_many = once
+        indexer.scan([library])
+        with pytest.raises(RuntimeError, match="interrupted"):
+            await indexer.resolve_pending()
+        return indexer.pending_serial_nos()
+
+    assert len(indexer_run(path, replay, interrupted, checkpoint_every=1)) == 1  # the first checkpoint is kept
+
+    stats = indexer_run(path, replay, lambda indexer: indexer.resolve_pending())
+    assert stats["resolved"] + stats["missing"] == 1
+
+
+def test_export_jsonl(tmp_path, library, replay):
+    path, path_jsonl = str(tmp_path / "library.db"), str(tmp_path / "catalog.jsonl")
+    indexer_run(path, replay, lambda indexer: indexer.refresh([library]))
+
+    entries = indexer_run(path, replay, lambda indexer: list(indexer.iter_catalog()))
+    assert indexer_run(path, replay, lambda indexer: indexer.export_jsonl(path_jsonl)) == 4
+    with open(path_jsonl, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    assert rows == [entry.to_dict() for entry in entries]
+
+    resolved = [entry for entry in entries if entry.resolved]
+    assert sorted(os.path.basename(entry.path) for entry in resolved) == ["ABC-123.mp4", "[HD] abc123 part2.mkv"]
+    for entry in resolved:
+        jav = entry.to_jav_info()
+        assert jav.serial_no_reg == entry.serial_no_reg == "ABC-123"
+        assert entry.title == jav.title and "ABC-123" not in entry.title
+
+
+def test_export_parquet(tmp_path, library, replay):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path, path_parquet = str(tmp_path / "library.db"), str(tmp_path / "catalog.parquet")
+    indexer_run(path, replay, lambda indexer: indexer.refresh([library]))
+
+    entries = indexer_run(path, replay, lambda indexer: list(indexer.iter_catalog()))
+    assert indexer_run(path, replay, lambda indexer: indexer.export_parquet(path_parquet, batch_size=3)) == 4
+    assert pq.read_table(path_parquet).to_pylist() == [entry.to_dict() for entry in entries]
@@ -0,0 +1,64 @@
+"""
+The single pass parser behind `SerialNoParser.parse_serial_nos` must agree with `SerialNoParser.parse_serial_no`.
+
+Usage:
+    python -m pytest tests
+"""
+
+import random
+
+import pytest
+
+from lib.external.base import SerialNoParser
+
+NAMES = [
+    "ABC-123.mp4",
+    "[HD] abc123 part2.mkv",
+    "abcd_0123 uncensored",
+    "FC2-PPV-1234567.mp4",
+    "fc2ppv_123456",
+    "FC-PPV 1234567",
+    "FC2 1234567 ABC-123",
+    "ABC-123 FC2-PPV-1234567",
+    "010120_001",
+    "123119-999 1pondo",
+    "ABC-123 010120_001",
+    "010120_001 ABC-123",
+    "122999_001",
+    "1234567",
+    "ABCDEF-123",
+    "AB-123",
+    "XABC-12345",
+    "random name.mp4",
+    "",
+]
+
+TOKENS = (
+    "FC2", "FC", "PPV", "ABC", "ABCD", "ABCDE", "ABCDEF", "AB", "X", "HD", "4K",
+    "-", "_", " ", "[", "]", ".mp4",
+    "1", "12", "123", "1234", "12345", "123456", "1234567", "12345678",
+    "010120", "123199", "131320", "000000",
+)
+
+
+def random_names(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    return ["".join(rng.choices(TOKENS, k=rng.randint(1, 8))) for _ in range(n)]
+
+
+@pytest.mark.parametrize("extend_fc2_from_no", [False, True])
+def test_single_pass_equivalence(extend_fc2_from_no):
+    for name in NAMES + random_names(20_000):
+        expected = SerialNoParser.parse_serial_no(name, extend_fc2_from_no)
+        res = SerialNoParser._parse_serial_no_single_pass(SerialNoParser.clean_serial_no(name), extend_fc2_from_no)
+        assert res == expected, name
+
+
+@pytest.mark.parametrize("extend_fc2_from_no", [False, True])
+def test_parse_serial_nos(extend_fc2_from_no):
+    names = NAMES + random_names(2_000, seed=1)
+    paths = [f"/library/sub dir/{name}" for name in names]
+
+    expected = [SerialNoParser.parse_serial_no(name, extend_fc2_from_no) for name in names]
+    assert SerialNoParser.parse_serial_nos(names, extend_fc2_from_no) == expected
+    assert SerialNoParser.parse_serial_nos(paths, extend_fc2_from_no) == expected
@@ -0,0 +1,512 @@
+"""
+Offline regression tests of source APIs, `Resolver`, `ThrottledTransport` and `CachedApi`, driven by
+`ReplayTransport` on the fixtures of `benchmarks/fixtures`.
+
+Usage:
+    python -m pytest tests
+"""
+
+import asyncio
+import os
+from contextlib import aclosing
+from typing import List, Optional
+
+import httpx
+import pytest
+
+from lib.external.base import BaseApi, CachedApi, JavInfo, JavRecord, MemoryCache, ReplayTransport
+from lib.external.base import ThrottledTransport, TransportConfig, UrlIndex
+from lib.external.base import transport as transport_module
+from lib.external.fc2 import FC2Api
+from lib.external.javlibrary import JavLibraryApi
+from lib.external.missav import MissAvApi
+from lib.external.resolver import ResolveError, Resolver
+from lib.external.tokyolib import TokyoLibApi
+
+FIXTURES = os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks", "fixtures")
+
+
+def run(coro_func, transport: httpx.AsyncBaseTransport, *args):
+    async def main():
+        async with httpx.AsyncClient(transport=transport) as session:
+            return await coro_func(session, *args)
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def replay() -> ReplayTransport:
+    return ReplayTransport.from_directory(FIXTURES)
+
+
+# source APIs
+
+@pytest.mark.parametrize("api_class", [MissAvApi, JavLibraryApi, TokyoLibApi])
+def test_detail(replay, api_class):
+    async def main(session):
+        return await api_class(session).get_video_detail("ABC-123")
+
+    jav = run(main, replay)
+    assert jav.serial_no_reg == "ABC-123"
+    assert jav.source == api_class.source
+    assert jav.publish_date == "2023-01-01"
+    assert jav.title != ""
+
+
+def test_detail_fc2(replay):
+    async def main(session):
+        return await FC2Api(session).get_video_detail("FC2-PPV-1000001")
+
+    jav = run(main, replay)
+    assert jav.serial_no == "FC2-PPV-1000001"
+    assert jav.title == "ある日の出来事"
+    assert jav.publish_date == "2023-01-01"
+    assert jav.length > 0
+
+
+@pytest.mark.parametrize("api_class, serial_no_reg", [
+    (MissAvApi, "ZZZ-001"),  # 404
+    (JavLibraryApi, "ZZZ-001"),  # empty search
+    (TokyoLibApi, "ZZZ-001"),  # empty search
+    (FC2Api, "FC2-PPV-9000001"),  # 404
+    (FC2Api, "FC2-PPV-8000001"),  # 302, missing or removed article
+    (FC2Api, "ABC-123"),  # not supported
+])
+def test_detail_miss(replay, api_class, serial_no_reg):
+    async def main(session):
+        return await api_class(session).get_video_detail(serial_no_reg)
+
+    assert run(main, replay) is None
+
+
+@pytest.mark.parametrize("api_class", [MissAvApi, JavLibraryApi, TokyoLibApi])
+def test_search(replay, api_class):
+    async def main(session):
+        api = api_class(session)
+        return await api.search_by_keyword("ABC"), await api.search_by_keyword("ZZZ-001")
+
+    records, records_empty = run(main, replay)
+    assert len(records) > 1
+    assert records[0].keyword == "ABC-123"
+    assert records_empty == []
+
+
+def test_search_javlibrary_redirect(replay):
+    async def main(session):
+        return await JavLibraryApi(session).search_by_keyword("ABC-123")
+
+    assert run(main, replay) == [JavRecord(keyword="ABC-123", title="", url="javli1")]
+
+
+@pytest.mark.parametrize("api_class, serial_no_reg", [
+    (MissAvApi, "ABC-123"),
+    (TokyoLibApi, "ABC-123"),
+    (FC2Api, "FC2-PPV-1000001"),
+])
+def test_detail_error_raises(api_class, serial_no_reg):
+    async def main(session):
+        return await api_class(session).get_video_detail(serial_no_reg)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run(main, ReplayTransport.from_directory(FIXTURES, error_rate=1.))
+
+
+# url index
+
+INDEXED = {
+    TokyoLibApi: ("https://tokyolib.com/v/abc-123", "https://tokyolib.com/v/gone-abc-123"),
+    JavLibraryApi: ("javli1", "gone1"),
+}
+
+
+@pytest.mark.parametrize("api_class", list(INDEXED))
+def test_url_index_hit(replay, api_class):
+    url, _ = INDEXED[api_class]
+
+    async def main(session):
+        url_index = UrlIndex()
+        url_index.put_many(api_class.source, [("ABC-123", url)])
+        return await api_class(session, url_index=url_index).get_video_detail("ABC-123")
+
+    assert run(main, replay).serial_no_reg == "ABC-123"
+    assert replay.n_requests == 1  # no search
+
+
+@pytest.mark.parametrize("api_class", list(INDEXED))
+def test_url_index_stale(replay, api_class):
+    url, url_stale = INDEXED[api_class]
+    url_index = UrlIndex()
+    url_index.put_many(api_class.source, [("ABC-123", url_stale)])
+
+    async def main(session):
+        return await api_class(session, url_index=url_index).get_video_detail("ABC-123")
+
+    assert run(main, replay).serial_no_reg == "ABC-123"
+    assert url_index.get(api_class.source, "ABC-123") == url  # replaced by the search
+
+
+@pytest.mark.parametrize("api_class", list(INDEXED))
+def test_url_index_kept_on_error(api_class):
+    url, _ = INDEXED[api_class]
+    url_index = UrlIndex()
+    url_index.put_many(api_class.source, [("ABC-123", url)])
+
+    async def main(session):
+        return await api_class(session, url_index=url_index).get_video_detail("ABC-123")
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run(main, ReplayTransport.from_directory(FIXTURES, error_rate=1.))
+    assert url_index.get(api_class.source, "ABC-123") == url
+
+
+@pytest.mark.parametrize("api_class", list(INDEXED))
+def test_warm_up_url_index(replay, api_class):
+    url, _ = INDEXED[api_class]
+    url_index = UrlIndex()
+
+    async def main(session):
+        api = api_class(session, url_index=url_index)
+        n_records = await api.warm_up_url_index(["ABC"], max_pages=1)
+        n_requests = replay.n_requests
+        await api.get_video_detail("ABC-123")
+        return n_records, replay.n_requests - n_requests
+
+    n_records, n_requests = run(main, replay)
+    assert n_records > 1
+    assert url_index.get(api_class.source, "ABC-123") == url
+    assert n_requests == 1
+
+
+# iter_search
+
+class PagedApi(BaseApi):
+    source = "Paged"
+
+    def __init__(self, pages: List[List[str]], repeat_last: bool = False, delay: float = 0.01):
+        super().__init__(None)
+        self.pages = pages
+        self.repeat_last = repeat_last
+        self.delay = delay
+        self.log = []  # ("request", page_no) when a page is scheduled, ("consume", page_no) when it is read
+        self.cancelled = []
+
+    def search_by_keyword(self, keyword: str, page_no=1):  # not async, to log when the request is scheduled
+        self.log.append(("request", page_no))
+        return self._page(page_no)
+
+    async def _page(self, page_no: int) -> List[JavRecord]:
+        try:
+            await asyncio.sleep(self.delay * page_no)  # later pages are still in flight when earlier ones are read
+        except asyncio.CancelledError:
+            self.cancelled.append(page_no)
+            raise
+
+        if page_no > len(self.pages):
+            urls = self.pages[-1] if self.repeat_last else []
+        else:
+            urls = self.pages[page_no - 1]
+        return [JavRecord(keyword=url, title="", url=url) for url in urls]
+
+    async def get_video_detail(self, serial_no_reg: str, with_thumbnail=False) -> Optional[JavInfo]:
+        return None
+
+
+def consume(api: PagedApi, n_records: Optional[int] = None, **kwargs) -> List[str]:
+    async def main():
+        urls, consumed = [], set()
+        async with aclosing(api.iter_search("ABC", **kwargs)) as records:
+            async for record in records:
+                if (page_no := int(record.url.split("-")[0])) not in consumed:
+                    consumed.add(page_no)
+                    api.log.append(("consume", page_no))
+                urls.append(record.url)
+                if len(urls) == n_records:
+                    break
+        return urls
+    return asyncio.run(main())
+
+
+def make_pages(n_pages: int, n_records: int = 2) -> List[List[str]]:
+    return [[f"{page_no}-{i}" for i in range(n_records)] for page_no in range(1, n_pages + 1)]
+
+
+def test_iter_search_sequential():
+    api = PagedApi(make_pages(3))
+    assert len(consume(api, prefetch=0)) == 6
+    assert api.log == [
+        ("request", 1), ("consume", 1), ("request", 2), ("consume", 2), ("request", 3), ("consume", 3), ("request", 4),
+    ]
+
+
+@pytest.mark.parametrize("prefetch", [0, 1, 2])
+def test_iter_search_prefetch(prefetch):
+    api = PagedApi(make_pages(5))
+    consume(api, prefetch=prefetch)
+
+    n_requested = 0
+    for event, page_no in api.log:
+        if event == "request":
+            n_requested += 1
+            assert page_no == n_requested  # in order
+        else:
+            assert n_requested == page_no + prefetch  # the page being consumed and `prefetch` ones after it
+
+
+def test_iter_search_dedupe():
+    api = PagedApi([["1-0", "1-1"], ["2-0", "1-1"], ["2-0", "1-0"], ["4-0"]])
+    assert consume(api, prefetch=1) == ["1-0", "1-1", "2-0"]  # page 3 brings nothing new
+
+
+def test_iter_search_repeated_last_page():
+    api = PagedApi(make_pages(2), repeat_last=True)
+    assert consume(api, prefetch=2) == ["1-0", "1-1", "2-0", "2-1"]
+
+
+def test_iter_search_max_pages():
+    api = PagedApi(make_pages(5))
+    assert len(consume(api, prefetch=3, max_pages=2)) == 4
+    assert max(page_no for _, page_no in api.log) == 2
+
+
+def test_iter_search_cancel_on_break():
+    api = PagedApi(make_pages(10))
+    assert consume(api, n_records=1, prefetch=3) == ["1-0"]
+    assert api.cancelled == [2, 3, 4]
+
+
+# Resolver
+
+class FakeApi(BaseApi):
+    def __init__(self, source: str, jav: Optional[JavInfo] = None, delay: float = 0., error: bool = False):
+        super().__init__(None)
+        self.source = source
+        self.jav = jav
+        self.delay = delay
+        self.error = error
+        self.n_calls = 0
+
+    async def search_by_keyword(self, keyword: str, page_no=1) -> List[JavRecord]:
+        return []
+
+    async def get_video_detail(self, serial_no_reg: str, with_thumbnail=False) -> Optional[JavInfo]:
+        self.n_calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise KeyError("layout changed")
+        return self.jav
+
+
+def resolve(resolver: Resolver, serial_no_reg: str, **kwargs):
+    return asyncio.run(resolver.resolve(serial_no_reg, **kwargs))
+
+
+def test_resolver_first_wins():
+    slow = FakeApi("Slow", JavInfo("ABC-123", title="slow", source="Slow"), delay=0.2)
+    fast = FakeApi("Fast", JavInfo("ABC-123", title="fast", source="Fast"), delay=0.01)
+    jav = resolve(Resolver([slow, fast], policy="first"), "ABC-123")
+    assert jav.source == "Fast"
+
+
+def test_resolver_first_skips_misses_and_errors():
+    apis = [
+        FakeApi("Miss"),
+        FakeApi("Broken", error=True),
+        FakeApi("Hit", JavInfo("ABC-123", title="hit", source="Hit"), delay=0.01),
+    ]
+    assert resolve(Resolver(apis, policy="first"), "ABC-123").source == "Hit"
+
+
+def test_resolver_merge():
+    apis = [
+        FakeApi("A", JavInfo("ABC-123", title="a", source="A")),
+        FakeApi("B", JavInfo("ABC-123", title="b", maker="MAKER", length=3600, source="B")),
+    ]
+    jav = resolve(Resolver(apis, policy="merge"), "ABC-123")
+    assert (jav.title, jav.maker, jav.length, jav.source) == ("a", "MAKER", 3600, "A,B")
+
+
+def test_resolver_deadline():
+    apis = [
+        FakeApi("Slow", JavInfo("ABC-123", title="slow", source="Slow"), delay=5.),
+        FakeApi("Fast", JavInfo("ABC-123", title="fast", maker="MAKER", source="Fast")),
+    ]
+    resolver = Resolver(apis, policy="merge", timeouts={"Slow": 0.05})
+
+    loop = asyncio.new_event_loop()
+    try:
+        start = loop.time()
+        jav = loop.run_until_complete(resolver.resolve("ABC-123"))
+        assert loop.time() - start < 1.
+    finally:
+        loop.close()
+    assert jav.source == "Fast"
+
+
+def test_resolver_miss():
+    assert resolve(Resolver([FakeApi("A"), FakeApi("B")]), "ABC-123") is None
+
+
+@pytest.mark.parametrize("policy", ["first", "merge"])
+def test_resolver_error(policy):
+    apis = [FakeApi("Miss"), FakeApi("Broken", error=True), FakeApi("Slow", delay=5.)]
+    with pytest.raises(ResolveError) as e:
+        resolve(Resolver(apis, policy=policy, timeouts={"Slow": 0.05}), "ABC-123")
+
+    assert set(e.value.errors) == {"Broken", "Slow"}
+    assert isinstance(e.value.errors["Broken"], KeyError)
+    assert isinstance(e.value.errors["Slow"], asyncio.TimeoutError)
+
+
+def test_resolver_resolve_many():
+    apis = [FakeApi("Broken", error=True), FakeApi("Hit", JavInfo("ABC-123", source="Hit"))]
+    apis[1].supports = lambda serial_no_reg: serial_no_reg == "ABC-123"
+
+    res = asyncio.run(Resolver(apis).resolve_many(["ABC-123", "ZZZ-001", "ABC-123"], concurrency=2))
+    assert res["ABC-123"].source == "Hit"
+    assert isinstance(res["ZZZ-001"], ResolveError)
+    assert apis[1].n_calls == 1
+
+
+def test_resolver_replay_outage():
+    async def main(session):
+        apis = [api_class(session) for api_class in (MissAvApi, JavLibraryApi, TokyoLibApi, FC2Api)]
+        return await Resolver(apis).resolve_many(["ABC-123", "FC2-PPV-9000001"])
+
+    res = run(main, ReplayTransport.from_directory(FIXTURES, error_rate=1.))
+    assert all(isinstance(x, ResolveError) for x in res.values())
+
+
+# ThrottledTransport
+
+@pytest.fixture
+def sleeps(monkeypatch) -> List[float]:
+    delays = []
+    sleep = asyncio.sleep
+
+    async def record(delay, *args, **kwargs):
+        delays.append(delay)
+        await sleep(0)
+
+    monkeypatch.setattr(transport_module.asyncio, "sleep", record)
+    return delays
+
+
+def throttled(responses: List[httpx.Response], **config) -> ThrottledTransport:
+    responses = iter(responses)
+    config = {"rate": None, "backoff_base": 0.01, **config}
+    return ThrottledTransport(TransportConfig(**config), transport=httpx.MockTransport(lambda request: next(responses)))
+
+
+async def get(session: httpx.AsyncClient, url: str = "https://example.com/") -> httpx.Response:
+    return await session.get(url)
+
+
+def test_throttled_retries(sleeps):
+    transport = throttled([httpx.Response(503), httpx.Response(502), httpx.Response(200)])
+    assert run(get, transport).status_code == 200
+    assert len(sleeps) == 2
+
+
+def test_throttled_gives_up(sleeps):
+    transport = throttled([httpx.Response(503)] * 3, max_retries=2)
+    assert run(get, transport).status_code == 503
+    assert len(sleeps) == 2
+
+
+def test_throttled_retry_after(sleeps):
+    transport = throttled([httpx.Response(429, headers={"retry-after": "7"}), httpx.Response(200)])
+    assert run(get, transport).status_code == 200
+    assert sleeps[0] == 7.
+
+
+def test_throttled_retry_after_too_long(sleeps):
+    transport = throttled([httpx.Response(429, headers={"retry-after": "3600"})], retry_after_max=60.)
+    assert run(get, transport).status_code == 429
+    assert sleeps == []
+
+
+def test_throttled_timeout(sleeps):
+    replay = ReplayTransport.from_directory(FIXTURES, timeout_rate=1.)
+    transport = ThrottledTransport(TransportConfig(rate=None, max_retries=2), transport=replay)
+    with pytest.raises(httpx.ReadTimeout):
+        run(get, transport, "https://missav.com/ja/ABC-123")
+    assert replay.n_requests == 3
+
+
+# CachedApi
+
+def test_cached_hit(replay):
+    async def main(session):
+        api = CachedApi(MissAvApi(session), MemoryCache(), ttl_hit=None)
+        first = await api.get_video_detail("ABC-123")
+        n_requests = replay.n_requests
+        second = await api.get_video_detail("abc123")  # same regularized serial number
+        assert replay.n_requests == n_requests
+        return first, second
+
+    first, second = run(main, replay)
+    assert first.to_dict() == second.to_dict()
+
+
+@pytest.mark.parametrize("api_class, loose, serial_no_reg", [
+    (FC2Api, "fc2-ppv-1000001", "FC2-PPV-1000001"),
+    (MissAvApi, "abc123", "ABC-123"),
+])
+def test_cached_loose_spelling_first(replay, api_class, loose, serial_no_reg):
+    async def main(session):
+        api = CachedApi(api_class(session), MemoryCache())
+        return await api.get_video_detail(loose), await api.get_video_detail(serial_no_reg)
+
+    first, second = run(main, replay)
+    assert first is not None
+    assert first.to_dict() == second.to_dict()
+
+
+@pytest.mark.parametrize("ttl_miss, n_extra_requests", [(3600., 0), (0., 1)])
+def test_cached_miss_ttl(replay, ttl_miss, n_extra_requests):
+    async def main(session):
+        api = CachedApi(MissAvApi(session), MemoryCache(), ttl_miss=ttl_miss)
+        assert await api.get_video_detail("ZZZ-001") is None
+        n_requests = replay.n_requests
+        assert await api.get_video_detail("ZZZ-001") is None
+        return replay.n_requests - n_requests
+
+    assert run(main, replay) == n_extra_requests
+
+
+def test_cached_fc2_redirect_is_miss(replay):
+    async def main(session):
+        cache = MemoryCache()
+        api = CachedApi(FC2Api(session), cache)
+        assert await api.get_video_detail("FC2-PPV-8000001") is None
+        return cache.get(api._key("detail", "FC2-PPV-8000001"))
+
+    assert run(main, replay) == "null"
+
+
+def test_cached_error_not_cached():
+    replay = ReplayTransport.from_directory(FIXTURES, error_rate=1.)
+
+    async def main(session):
+        cache = MemoryCache()
+        api = CachedApi(FC2Api(session), cache)
+        with pytest.raises(httpx.HTTPStatusError):
+            await api.get_video_detail("FC2-PPV-1000001")
+        assert len(cache) == 0
+
+        replay.error_rate = 0.
+        return await api.get_video_detail("FC2-PPV-1000001")
+
+    assert run(main, replay).title == "ある日の出来事"
+
+
+def test_cached_search_key(replay):
+    async def main(session):
+        cache = MemoryCache()
+        api = CachedApi(MissAvApi(session), cache)
+        await api.search_by_keyword("ABC", 2)
+        await api.search_by_keyword("abc", page_no=2)
+        await api.search_by_keyword("ABC-123 uncensored")
+        await api.search_by_keyword("ABC-123")
+        return len(cache)
+
+    assert run(main, replay) == 3